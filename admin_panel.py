@@ -1,23 +1,160 @@
 import streamlit as st
 import requests
 import pandas as pd
+import time
+import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson is optional; fall back to the stdlib codec when it isn't installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
+_USER_COLUMNS = ('username', 'email', 'full_name', 'role_name', 'created_at')
+_ROLE_MAP = {"admin": 1, "manager": 2, "user": 3}
+_ROLE_OPTIONS = ("user", "manager", "admin")
+_PAGE_SIZE = 50
+_SESSION_CACHE_TTL = 30
+
+@st.cache_resource
+def _get_session():
+    """Shared HTTP session so admin calls reuse pooled connections"""
+    # uvicorn only speaks HTTP/1.1, so keep-alive reuse is what saves the
+    # handshakes here; an HTTP/2 client would just fall back to 1.1.
+    session = requests.Session()
+    session.headers["User-Agent"] = "admin-panel"
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504])
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_users(api_base, token, page, size):
+    """Fetch one page of users; cached so widget reruns don't hit the API"""
+    response = _get_session().get(
+        f"{api_base}/admin/users",
+        params={"offset": (page - 1) * size, "limit": size},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=10
+    )
+    response.raise_for_status()
+    return _json_loads(response.content)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_usernames(api_base, token):
+    """Fetch every username for the update/delete selectboxes"""
+    response = _get_session().get(
+        f"{api_base}/admin/users",
+        params={"fields": "username"},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=10
+    )
+    response.raise_for_status()
+    return [user['username'] for user in _json_loads(response.content)]
+
+def _session_users(page):
+    """This session's last fetch, if it is still fresh and for the same page"""
+    cached = st.session_state.get('admin_users_cache')
+    if cached and cached['page'] == page and time.monotonic() - cached['ts'] < _SESSION_CACHE_TTL:
+        return cached
+    return None
+
+def _clear_user_cache():
+    """Drop cached user data after a mutation"""
+    st.session_state.pop('admin_users_cache', None)
+    _fetch_users.clear()
+    _fetch_usernames.clear()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _users_table(users):
+    """Build the users table from only the displayed columns"""
+    table = pd.DataFrame(
+        [{col: user.get(col) for col in _USER_COLUMNS} for user in users],
+        columns=list(_USER_COLUMNS)
+    )
+    # created_at arrives as unix seconds; older backends sent timestamp strings
+    if pd.api.types.is_numeric_dtype(table['created_at']):
+        table['created_at'] = pd.to_datetime(table['created_at'], unit='s')
+    return table
+
+def _detail(response):
+    """Error detail from a response, tolerating non-JSON bodies"""
+    try:
+        return _json_loads(response.content).get('detail', 'Unknown error')
+    except Exception:
+        return response.text[:200] or f"HTTP {response.status_code}"
+
+def _accept_submit(form_name, window=1.2):
+    """Leading-edge debounce: ignore repeat submits of a form within `window` seconds"""
+    key = f"_last_submit_{form_name}"
+    now = time.monotonic()
+    last = st.session_state.get(key)
+    if last is not None and now - last < window:
+        return False
+    st.session_state[key] = now
+    return True
 
 def show_admin_panel(api_base, token):
     """Admin panel for user management"""
+    loaded = st.session_state.get('admin_loaded')
+    page = st.session_state.get('admin_users_page', 1)
+    session_cache = _session_users(page) if loaded else None
+
     st.header("👥 User Management (Admin Only)")
-    
+
+    # Only fetch users once the admin asks for them
+    if not loaded:
+        if st.button("📥 Load Users"):
+            st.session_state['admin_loaded'] = True
+            st.rerun()
+        return
+
+    if st.button("🔄 Refresh Users"):
+        _clear_user_cache()
+        st.rerun()
+
     # Get all users
     headers = {"Authorization": f"Bearer {token}"}
+    json_headers = {**headers, "Content-Type": "application/json"}
     
     try:
-        response = requests.get(f"{api_base}/admin/users", headers=headers, timeout=10)
-        if response.status_code == 200:
-            users = response.json()
-            
-            if users:
-                # Display users table
-                df_users = pd.DataFrame(users)
-                st.dataframe(df_users[['username', 'email', 'full_name', 'role_name', 'created_at']], use_container_width=True)
+        if session_cache is not None:
+            users, usernames = session_cache['users'], session_cache['usernames']
+        else:
+            try:
+                users = _fetch_users(api_base, token, page, _PAGE_SIZE)
+                usernames = _fetch_usernames(api_base, token)
+                st.session_state['admin_users_cache'] = {
+                    'page': page,
+                    'users': users,
+                    'usernames': usernames,
+                    'ts': time.monotonic()
+                }
+            except requests.HTTPError:
+                users = None
+        
+        if users is not None:
+            if usernames:
+                # Display one page of the users table
+                st.number_input("Page", min_value=1, step=1, key="admin_users_page")
+                if users:
+                    st.dataframe(_users_table(users), use_container_width=True)
+                else:
+                    st.info("No users on this page.")
+                
+                # Selectbox options, computed once per fetch
+                protected_users = {'admin', st.session_state.user['username']}
+                updatable_users = tuple(name for name in usernames if name != 'admin')
+                deletable_users = tuple(name for name in usernames if name not in protected_users)
                 
                 # User management actions
                 col1, col2 = st.columns(2)
@@ -25,34 +162,37 @@ def show_admin_panel(api_base, token):
                 with col1:
                     st.subheader("🔄 Update User Role")
                     with st.form("update_role_form"):
-                        update_username = st.selectbox("Select User", [user['username'] for user in users if user['username'] != 'admin'])
-                        new_role = st.selectbox("New Role", ["user", "manager", "admin"], format_func=lambda x: x.capitalize())
+                        update_usernames = st.multiselect("Select Users", updatable_users)
+                        new_role = st.selectbox("New Role", _ROLE_OPTIONS, format_func=str.capitalize)
                         
-                        if st.form_submit_button("Update Role"):
-                            role_map = {"admin": 1, "manager": 2, "user": 3}
-                            update_data = {"role_id": role_map[new_role]}
-                            
-                            update_response = requests.put(
-                                f"{api_base}/admin/users/{update_username}/role",
-                                headers=headers,
-                                json=update_data,
-                                timeout=10
-                            )
-                            
-                            if update_response.status_code == 200:
-                                st.success(f"✅ Updated {update_username} to {new_role} role")
-                                st.rerun()
+                        if st.form_submit_button("Update Role") and _accept_submit("update_role_form"):
+                            if update_usernames:
+                                role_id = _ROLE_MAP[new_role]
+                                payload = [{"username": name, "role_id": role_id} for name in update_usernames]
+                                
+                                update_response = _get_session().put(
+                                    f"{api_base}/admin/users/roles",
+                                    headers=json_headers,
+                                    data=_json_dumps(payload),
+                                    timeout=10
+                                )
+                                
+                                if update_response.status_code == 200:
+                                    st.success(f"✅ Updated {', '.join(update_usernames)} to {new_role} role")
+                                    _clear_user_cache()
+                                    st.rerun()
+                                else:
+                                    st.error(f"❌ Failed to update role: {_detail(update_response)}")
                             else:
-                                st.error(f"❌ Failed to update role: {update_response.json().get('detail', 'Unknown error')}")
+                                st.error("Please select at least one user")
                 
                 with col2:
                     st.subheader("🗑️ Delete User")
                     with st.form("delete_user_form"):
-                        delete_username = st.selectbox("Select User to Delete", 
-                                                    [user['username'] for user in users if user['username'] not in ['admin', st.session_state.user['username']]])
+                        delete_username = st.selectbox("Select User to Delete", deletable_users)
                         
-                        if st.form_submit_button("Delete User", type="secondary"):
-                            delete_response = requests.delete(
+                        if st.form_submit_button("Delete User", type="secondary") and _accept_submit("delete_user_form"):
+                            delete_response = _get_session().delete(
                                 f"{api_base}/admin/users/{delete_username}",
                                 headers=headers,
                                 timeout=10
@@ -60,9 +200,10 @@ def show_admin_panel(api_base, token):
                             
                             if delete_response.status_code == 200:
                                 st.success(f"✅ User {delete_username} deleted successfully")
+                                _clear_user_cache()
                                 st.rerun()
                             else:
-                                st.error(f"❌ Failed to delete user: {delete_response.json().get('detail', 'Unknown error')}")
+                                st.error(f"❌ Failed to delete user: {_detail(delete_response)}")
                 
                 # Create new user
                 st.subheader("➕ Create New User")
@@ -73,32 +214,34 @@ def show_admin_panel(api_base, token):
                         new_email = st.text_input("Email")
                     with col2:
                         new_full_name = st.text_input("Full Name")
-                        new_password = st.text_input("Password", type="password")
-                        new_role = st.selectbox("Role", ["user", "manager", "admin"], format_func=lambda x: x.capitalize())
+                        new_password = st.text_input("Password", type="password", key="create_user_password")
+                        new_role = st.selectbox("Role", _ROLE_OPTIONS, format_func=str.capitalize)
                     
-                    if st.form_submit_button("Create User"):
+                    if st.form_submit_button("Create User") and _accept_submit("create_user_form"):
                         if new_username and new_email and new_password:
-                            role_map = {"admin": 1, "manager": 2, "user": 3}
-                            user_data = {
+                            body = _json_dumps({
                                 "username": new_username,
                                 "email": new_email,
                                 "password": new_password,
                                 "full_name": new_full_name,
-                                "role_id": role_map[new_role]
-                            }
+                                "role_id": _ROLE_MAP[new_role]
+                            })
                             
-                            create_response = requests.post(
+                            create_response = _get_session().post(
                                 f"{api_base}/admin/users",
-                                headers=headers,
-                                json=user_data,
+                                headers=json_headers,
+                                data=body,
                                 timeout=10
                             )
                             
                             if create_response.status_code == 200:
                                 st.success("✅ User created successfully!")
+                                # Empty the password field only once the user exists, so a failed create can be retried
+                                st.session_state.pop("create_user_password", None)
+                                _clear_user_cache()
                                 st.rerun()
                             else:
-                                st.error(f"❌ Failed to create user: {create_response.json().get('detail', 'Unknown error')}")
+                                st.error(f"❌ Failed to create user: {_detail(create_response)}")
                         else:
                             st.error("Please fill all required fields")
             else:
@@ -1,19 +1,212 @@
 from typing import Dict, Any, List, Optional
-from database import get_db_connection
+from database import get_db_connection_ro
 import sqlite3
+from itertools import chain
+import functools
 import logging
+import re
+import time
 
 logger = logging.getLogger(__name__)
 
+LOW_STOCK_THRESHOLD = 10
+ANALYTICS_CACHE_TTL = 30
+
+# Memoized analytics results: method name -> (timestamp, result)
+_analytics_cache: Dict[str, tuple] = {}
+
+def _is_error_result(result: Dict[str, Any]) -> bool:
+    """True for the fallback dicts the analytics methods return on failure"""
+    return 'error' in result or any(isinstance(v, dict) and 'error' in v for v in result.values())
+
+def memoize_analytics(key: str, compute, ttl: float = ANALYTICS_CACHE_TTL):
+    """Serve compute() from the analytics cache under `key` for `ttl` seconds
+    
+    Every caller within the TTL gets the same result object, so treat it as
+    read-only; build a new dict to change anything. Entries are dropped
+    with the rest of the cache when data changes.
+    """
+    entry = _analytics_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < ttl:
+        return entry[1]
+    result = compute()
+    if not _is_error_result(result):
+        _analytics_cache[key] = (time.monotonic(), result)
+    return result
+
+def _ttl_cached(func):
+    """Serve a no-argument analytics method from cache for ANALYTICS_CACHE_TTL seconds"""
+    name = func.__name__
+    
+    @functools.wraps(func)
+    def wrapper():
+        return memoize_analytics(name, func)
+    return wrapper
+
+def invalidate_analytics_cache():
+    """Drop memoized analytics after data changes"""
+    _analytics_cache.clear()
+
+# Product columns the tools read; listed explicitly so SQLite returns no more than needed
+_PRODUCT_COLUMNS = "p.product_id, p.product_name, p.price, p.stock_quantity, p.category_id, p.subcategory_id, pc.category_name"
+
+# Static analytics queries, kept as module constants so every call sends
+# identical SQL text and hits the connection's prepared-statement cache
+_LOW_STOCK_SQL = f"""
+    SELECT {_PRODUCT_COLUMNS}
+    FROM product p 
+    JOIN product_category pc ON p.category_id = pc.category_id AND p.subcategory_id = pc.subcategory_id
+    WHERE p.stock_quantity < ?
+    ORDER BY p.stock_quantity ASC
+"""
+
+# Per-category stats, product totals and price range in one statement. The
+# totals row always exists, so LEFT JOIN keeps it even with no categories.
+_SALES_TRENDS_SQL = """
+    WITH totals AS (
+        SELECT 
+            COUNT(*) as total_products,
+            CAST(COALESCE(AVG(price), 0) AS REAL) as overall_avg_price,
+            CAST(COALESCE(SUM(stock_quantity), 0) AS INTEGER) as total_inventory,
+            COALESCE(SUM(CASE WHEN stock_quantity < ? THEN 1 ELSE 0 END), 0) as low_stock_count,
+            CAST(COALESCE(MIN(price), 0) AS REAL) as min_price,
+            CAST(COALESCE(MAX(price), 0) AS REAL) as max_price
+        FROM product
+    ),
+    category_stats AS (
+        SELECT 
+            pc.category_name, 
+            COUNT(p.product_id) as product_count,
+            CAST(COALESCE(AVG(p.price), 0) AS REAL) as avg_price, 
+            CAST(COALESCE(SUM(p.stock_quantity), 0) AS INTEGER) as total_stock,
+            CAST(COALESCE(MIN(p.stock_quantity), 0) AS INTEGER) as min_stock,
+            CAST(COALESCE(MAX(p.stock_quantity), 0) AS INTEGER) as max_stock
+        FROM product p 
+        JOIN product_category pc ON p.category_id = pc.category_id AND p.subcategory_id = pc.subcategory_id
+        GROUP BY pc.category_name
+    )
+    SELECT totals.*, category_stats.*
+    FROM totals
+    LEFT JOIN category_stats ON 1 = 1
+    ORDER BY category_stats.product_count DESC
+"""
+_CATEGORY_STATS_COLUMNS = ('category_name', 'product_count', 'avg_price', 'total_stock', 'min_stock', 'max_stock')
+_TOTAL_STATS_COLUMNS = ('total_products', 'overall_avg_price', 'total_inventory', 'low_stock_count')
+_PRICE_STATS_COLUMNS = ('min_price', 'max_price')
+
+_ROLE_DISTRIBUTION_SQL = """
+    SELECT 
+        r.role_name, 
+        COUNT(u.id) as user_count,
+        COALESCE(SUM(CASE WHEN u.is_active = TRUE THEN 1 ELSE 0 END), 0) as active_users
+    FROM users u 
+    JOIN roles r ON u.role_id = r.role_id
+    GROUP BY r.role_name
+    ORDER BY user_count DESC
+"""
+
+# Scalar subqueries rather than CASE sums, so the active count is served by
+# the idx_users_active partial index instead of a full table scan
+_USER_ACTIVITY_SQL = """
+    SELECT 
+        (SELECT COUNT(*) FROM users) as total_users,
+        (SELECT COUNT(*) FROM users WHERE is_active = 1) as active_users_count,
+        (SELECT COUNT(*) FROM users WHERE is_active = 0) as inactive_users_count,
+        (SELECT datetime(MIN(created_at), 'unixepoch') FROM users) as first_user_date,
+        (SELECT datetime(MAX(created_at), 'unixepoch') FROM users) as latest_user_date
+"""
+
+_RECENT_USERS_SQL = """
+    SELECT 
+        username, 
+        email, 
+        role_id,
+        datetime(created_at, 'unixepoch') as created_at
+    FROM users 
+    ORDER BY created_at DESC 
+    LIMIT 5
+"""
+
+_CATEGORY_INSIGHTS_SQL = """
+    SELECT 
+        pc.category_id,
+        pc.subcategory_id,
+        pc.category_name,
+        COUNT(p.product_id) as product_count,
+        CAST(COALESCE(AVG(p.price), 0) AS REAL) as avg_price,
+        CAST(COALESCE(SUM(p.stock_quantity), 0) AS INTEGER) as total_stock
+    FROM product_category pc
+    LEFT JOIN product p ON pc.category_id = p.category_id AND pc.subcategory_id = p.subcategory_id
+    GROUP BY pc.category_id, pc.subcategory_id, pc.category_name
+    ORDER BY product_count DESC
+"""
+
+_LOW_STOCK_CATEGORIES_SQL = """
+    SELECT 
+        pc.category_name,
+        COUNT(p.product_id) as low_stock_count
+    FROM product_category pc
+    JOIN product p ON pc.category_id = p.category_id AND pc.subcategory_id = p.subcategory_id
+    WHERE p.stock_quantity < ?
+    GROUP BY pc.category_name
+    ORDER BY low_stock_count DESC
+"""
+
+# Application table names; the schema doesn't change at runtime
+_user_tables: Optional[tuple] = None
+
+# Per-table count fragments, built once from the whitelisted table names
+_table_count_sql: Dict[str, str] = {}
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _list_user_tables(cursor) -> tuple:
+    """Return the application table names, querying sqlite_master only once"""
+    global _user_tables
+    if _user_tables is None:
+        cursor.execute("""
+            SELECT name FROM sqlite_master 
+            WHERE type='table' AND name NOT LIKE 'sqlite_%'
+        """)
+        # Table names get interpolated into SQL, so only plain identifiers are kept
+        tables = tuple(row[0] for row in cursor if _IDENTIFIER.match(row[0]))
+        _table_count_sql.update({
+            table: f" UNION ALL SELECT 'table:{table}', COUNT(*) FROM {table}" for table in tables
+        })
+        _user_tables = tables
+    return _user_tables
+
+def _table_row_estimates(cursor) -> Dict[str, int]:
+    """Row counts recorded by the last ANALYZE, keyed by table name"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'")
+    if cursor.fetchone() is None:
+        return {}
+    cursor.execute("SELECT tbl, stat FROM sqlite_stat1")
+    estimates = {}
+    for table, stat in cursor:
+        # The first field of stat is the row count of the table (or of the
+        # index, which is smaller for partial indexes), so keep the largest
+        try:
+            rows = int(str(stat).split(' ', 1)[0])
+        except ValueError:
+            continue
+        if rows > estimates.get(table, -1):
+            estimates[table] = rows
+    return estimates
+
 class AICRUDTools:
     """Tools for AI agent to perform CRUD operations"""
     
     @staticmethod
     def safe_float(value: Any) -> float:
         """Safely convert value to float, return 0.0 if invalid"""
+        # SQLite hands back plain ints and floats; skip the exception path for them
+        if value is None:
+            return 0.0
+        if type(value) is float:
+            return value
+        if type(value) is int:
+            return float(value)
         try:
-            if value is None:
-                return 0.0
             return float(value)
         except (ValueError, TypeError):
             return 0.0
@@ -21,9 +214,11 @@ class AICRUDTools:
     @staticmethod
     def safe_int(value: Any) -> int:
         """Safely convert value to int, return 0 if invalid"""
+        if value is None:
+            return 0
+        if type(value) is int:
+            return value
         try:
-            if value is None:
-                return 0
             return int(value)
         except (ValueError, TypeError):
             return 0
@@ -32,42 +227,35 @@ class AICRUDTools:
     def search_products(query: str, category_filter: Optional[str] = None) -> List[Dict]:
         """Search products with natural language understanding"""
         try:
-            with get_db_connection() as conn:
+            with get_db_connection_ro(row_factory=None) as conn:
                 cursor = conn.cursor()
                 
-                base_query = """
-                    SELECT p.*, pc.category_name 
+                base_query = f"""
+                    SELECT {_PRODUCT_COLUMNS}
                     FROM product p 
                     JOIN product_category pc ON p.category_id = pc.category_id AND p.subcategory_id = pc.subcategory_id
                     WHERE 1=1
                 """
                 params = []
                 
-                # Simple keyword-based search
-                if query:
-                    base_query += " AND (p.product_name LIKE ? OR p.product_name LIKE ? OR pc.category_name LIKE ?)"
-                    params.extend([f'%{query}%', f'%{query.title()}%', f'%{query}%'])
-                
+                # Predicates are appended cheapest first: SQLite evaluates WHERE
+                # terms in order, so narrow filters should run before the
+                # per-row '%...%' LIKE scans. Keep new filters ahead of those.
                 if category_filter:
                     base_query += " AND pc.category_name LIKE ?"
                     params.append(f'%{category_filter}%')
                 
+                # Simple keyword-based search
+                if query:
+                    # LIKE is already case-insensitive for ASCII
+                    base_query += " AND (p.product_name LIKE ? OR pc.category_name LIKE ?)"
+                    params.extend([f'%{query}%', f'%{query}%'])
+                
                 base_query += " ORDER BY p.product_name"
                 
                 logger.info(f"Executing search query: {base_query} with params: {params}")
                 cursor.execute(base_query, params)
-                results = cursor.fetchall()
-                
-                products = []
-                for row in results:
-                    product_dict = dict(row)
-                    # Convert price to float for JSON serialization
-                    if 'price' in product_dict:
-                        product_dict['price'] = AICRUDTools.safe_float(product_dict['price'])
-                    # Ensure stock_quantity is int
-                    if 'stock_quantity' in product_dict:
-                        product_dict['stock_quantity'] = AICRUDTools.safe_int(product_dict['stock_quantity'])
-                    products.append(product_dict)
+                products = _rows_to_dicts(cursor)
                 
                 logger.info(f"Found {len(products)} products matching search")
                 return products
@@ -77,29 +265,13 @@ class AICRUDTools:
             return []
     
     @staticmethod
-    def get_low_stock_products(threshold: int = 10) -> List[Dict]:
+    def get_low_stock_products(threshold: int = LOW_STOCK_THRESHOLD) -> List[Dict]:
         """Get products with low stock"""
         try:
-            with get_db_connection() as conn:
+            with get_db_connection_ro(row_factory=None) as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT p.*, pc.category_name 
-                    FROM product p 
-                    JOIN product_category pc ON p.category_id = pc.category_id AND p.subcategory_id = pc.subcategory_id
-                    WHERE p.stock_quantity < ?
-                    ORDER BY p.stock_quantity ASC
-                """, (threshold,))
-                
-                results = cursor.fetchall()
-                products = []
-                for row in results:
-                    product_dict = dict(row)
-                    # Safe conversion of numeric fields
-                    if 'price' in product_dict:
-                        product_dict['price'] = AICRUDTools.safe_float(product_dict['price'])
-                    if 'stock_quantity' in product_dict:
-                        product_dict['stock_quantity'] = AICRUDTools.safe_int(product_dict['stock_quantity'])
-                    products.append(product_dict)
+                cursor.execute(_LOW_STOCK_SQL, (threshold,))
+                products = _rows_to_dicts(cursor)
                 
                 logger.info(f"Found {len(products)} low stock products")
                 return products
@@ -109,80 +281,25 @@ class AICRUDTools:
             return []
     
     @staticmethod
+    @_ttl_cached
     def get_sales_trends() -> Dict[str, Any]:
         """Get basic sales trends and statistics"""
         try:
-            with get_db_connection() as conn:
+            with get_db_connection_ro() as conn:
                 cursor = conn.cursor()
                 
+                cursor.execute(_SALES_TRENDS_SQL, (LOW_STOCK_THRESHOLD,))
+                first = cursor.fetchone()
+                
+                # Total statistics and price range come from the shared totals columns
+                total_stats = {col: first[col] for col in _TOTAL_STATS_COLUMNS}
+                price_stats = {col: first[col] for col in _PRICE_STATS_COLUMNS}
+                
                 # Product count by category
-                cursor.execute("""
-                    SELECT 
-                        pc.category_name, 
-                        COUNT(p.product_id) as product_count,
-                        AVG(p.price) as avg_price, 
-                        SUM(p.stock_quantity) as total_stock,
-                        MIN(p.stock_quantity) as min_stock,
-                        MAX(p.stock_quantity) as max_stock
-                    FROM product p 
-                    JOIN product_category pc ON p.category_id = pc.category_id AND p.subcategory_id = pc.subcategory_id
-                    GROUP BY pc.category_name
-                    ORDER BY product_count DESC
-                """)
-                category_stats = []
-                for row in cursor.fetchall():
-                    stat_dict = dict(row)
-                    # Safe conversion of numeric fields
-                    if 'avg_price' in stat_dict:
-                        stat_dict['avg_price'] = AICRUDTools.safe_float(stat_dict['avg_price'])
-                    if 'total_stock' in stat_dict:
-                        stat_dict['total_stock'] = AICRUDTools.safe_int(stat_dict['total_stock'])
-                    if 'min_stock' in stat_dict:
-                        stat_dict['min_stock'] = AICRUDTools.safe_int(stat_dict['min_stock'])
-                    if 'max_stock' in stat_dict:
-                        stat_dict['max_stock'] = AICRUDTools.safe_int(stat_dict['max_stock'])
-                    if 'product_count' in stat_dict:
-                        stat_dict['product_count'] = AICRUDTools.safe_int(stat_dict['product_count'])
-                    category_stats.append(stat_dict)
-                
-                # Total statistics
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_products,
-                        AVG(price) as overall_avg_price,
-                        SUM(stock_quantity) as total_inventory,
-                        SUM(CASE WHEN stock_quantity < 10 THEN 1 ELSE 0 END) as low_stock_count
-                    FROM product
-                """)
-                total_stats_row = cursor.fetchone()
-                total_stats = {}
-                if total_stats_row:
-                    total_stats = dict(total_stats_row)
-                    # Safe conversion
-                    if 'overall_avg_price' in total_stats:
-                        total_stats['overall_avg_price'] = AICRUDTools.safe_float(total_stats['overall_avg_price'])
-                    if 'total_inventory' in total_stats:
-                        total_stats['total_inventory'] = AICRUDTools.safe_int(total_stats['total_inventory'])
-                    if 'low_stock_count' in total_stats:
-                        total_stats['low_stock_count'] = AICRUDTools.safe_int(total_stats['low_stock_count'])
-                    if 'total_products' in total_stats:
-                        total_stats['total_products'] = AICRUDTools.safe_int(total_stats['total_products'])
-                
-                # Price range analysis
-                cursor.execute("""
-                    SELECT 
-                        MIN(price) as min_price,
-                        MAX(price) as max_price
-                    FROM product
-                """)
-                price_stats_row = cursor.fetchone()
-                price_stats = {}
-                if price_stats_row:
-                    price_stats = dict(price_stats_row)
-                    if 'min_price' in price_stats:
-                        price_stats['min_price'] = AICRUDTools.safe_float(price_stats['min_price'])
-                    if 'max_price' in price_stats:
-                        price_stats['max_price'] = AICRUDTools.safe_float(price_stats['max_price'])
+                category_stats = [
+                    {col: row[col] for col in _CATEGORY_STATS_COLUMNS}
+                    for row in chain((first,), cursor) if row['category_name'] is not None
+                ]
                 
                 # Calculate low stock count safely
                 low_stock_count = total_stats.get('low_stock_count', 0)
@@ -234,7 +351,8 @@ class AICRUDTools:
             # Validate data types
             validation_errors = []
             
-            if not isinstance(product_data['product_name'], str) or len(product_data['product_name'].strip()) == 0:
+            product_name = product_data['product_name'].strip() if isinstance(product_data['product_name'], str) else ''
+            if not product_name:
                 validation_errors.append("product_name must be a non-empty string")
             
             if not isinstance(product_data['category_id'], int) or product_data['category_id'] <= 0:
@@ -243,6 +361,7 @@ class AICRUDTools:
             if not isinstance(product_data['subcategory_id'], int) or product_data['subcategory_id'] <= 0:
                 validation_errors.append("subcategory_id must be a positive integer")
             
+            price = None
             try:
                 price = float(product_data['price'])
                 if price <= 0:
@@ -261,7 +380,7 @@ class AICRUDTools:
                 }
             
             # Check if category exists
-            with get_db_connection() as conn:
+            with get_db_connection_ro() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT category_name FROM product_category WHERE category_id = ? AND subcategory_id = ?",
@@ -272,7 +391,7 @@ class AICRUDTools:
                 if not category:
                     # Get available categories for suggestion
                     cursor.execute("SELECT DISTINCT category_id, subcategory_id, category_name FROM product_category LIMIT 10")
-                    available_categories = [dict(row) for row in cursor.fetchall()]
+                    available_categories = [dict(row) for row in cursor]
                     
                     return {
                         "status": "error",
@@ -287,10 +406,10 @@ class AICRUDTools:
                 "message": "Product data is valid and ready for creation",
                 "suggested_action": "create_product",
                 "validated_data": {
-                    "product_name": product_data['product_name'].strip(),
+                    "product_name": product_name,
                     "category_id": product_data['category_id'],
                     "subcategory_id": product_data['subcategory_id'],
-                    "price": float(product_data['price']),
+                    "price": price,
                     "stock_quantity": product_data['stock_quantity']
                 },
                 "category_info": dict(category) if category else None
@@ -304,72 +423,35 @@ class AICRUDTools:
             }
     
     @staticmethod
+    @_ttl_cached
     def analyze_user_behavior() -> Dict[str, Any]:
         """Analyze user patterns and behavior"""
         try:
-            with get_db_connection() as conn:
+            with get_db_connection_ro() as conn:
                 cursor = conn.cursor()
                 
                 # User role distribution
-                cursor.execute("""
-                    SELECT 
-                        r.role_name, 
-                        COUNT(u.id) as user_count,
-                        SUM(CASE WHEN u.is_active = TRUE THEN 1 ELSE 0 END) as active_users
-                    FROM users u 
-                    JOIN roles r ON u.role_id = r.role_id
-                    GROUP BY r.role_name
-                    ORDER BY user_count DESC
-                """)
-                role_distribution = []
-                for row in cursor.fetchall():
-                    role_dict = dict(row)
-                    # Safe conversion
-                    if 'user_count' in role_dict:
-                        role_dict['user_count'] = AICRUDTools.safe_int(role_dict['user_count'])
-                    if 'active_users' in role_dict:
-                        role_dict['active_users'] = AICRUDTools.safe_int(role_dict['active_users'])
-                    role_distribution.append(role_dict)
+                cursor.execute(_ROLE_DISTRIBUTION_SQL)
+                role_distribution = [dict(row) for row in cursor]
                 
                 # User activity analysis
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_users,
-                        SUM(CASE WHEN is_active = TRUE THEN 1 ELSE 0 END) as active_users_count,
-                        SUM(CASE WHEN is_active = FALSE THEN 1 ELSE 0 END) as inactive_users_count,
-                        MIN(created_at) as first_user_date,
-                        MAX(created_at) as latest_user_date
-                    FROM users
-                """)
-                user_activity_row = cursor.fetchone()
-                user_activity = {}
-                if user_activity_row:
-                    user_activity = dict(user_activity_row)
-                    # Safe conversion
-                    for key in ['total_users', 'active_users_count', 'inactive_users_count']:
-                        if key in user_activity:
-                            user_activity[key] = AICRUDTools.safe_int(user_activity[key])
+                cursor.execute(_USER_ACTIVITY_SQL)
+                row = cursor.fetchone()
+                user_activity = dict(row) if row else {}
                 
                 # Recent user registrations
-                cursor.execute("""
-                    SELECT 
-                        username, 
-                        email, 
-                        role_id,
-                        created_at
-                    FROM users 
-                    ORDER BY created_at DESC 
-                    LIMIT 5
-                """)
-                recent_users = [dict(row) for row in cursor.fetchall()]
+                cursor.execute(_RECENT_USERS_SQL)
+                recent_users = [dict(row) for row in cursor]
                 
                 # Calculate totals safely
                 total_active_users = user_activity.get('active_users_count', 0)
                 total_inactive_users = user_activity.get('inactive_users_count', 0)
                 
-                admin_count = next((AICRUDTools.safe_int(role['user_count']) for role in role_distribution if role.get('role_name') == 'admin'), 0)
-                manager_count = next((AICRUDTools.safe_int(role['user_count']) for role in role_distribution if role.get('role_name') == 'manager'), 0)
-                user_count = next((AICRUDTools.safe_int(role['user_count']) for role in role_distribution if role.get('role_name') == 'user'), 0)
+                # Role counts, indexed once for the lookups below
+                by_role = {role.get('role_name'): role['user_count'] for role in role_distribution}
+                admin_count = AICRUDTools.safe_int(by_role.get('admin', 0))
+                manager_count = AICRUDTools.safe_int(by_role.get('manager', 0))
+                user_count = AICRUDTools.safe_int(by_role.get('user', 0))
                 
                 return {
                     "user_analytics": {
@@ -401,46 +483,45 @@ class AICRUDTools:
             }
     
     @staticmethod
+    @_ttl_cached
     def get_system_health() -> Dict[str, Any]:
         """Get system health metrics"""
         try:
-            with get_db_connection() as conn:
+            with get_db_connection_ro() as conn:
                 cursor = conn.cursor()
                 
-                # Basic counts with safe conversion
-                cursor.execute("SELECT COUNT(*) as count FROM product_category")
-                category_count = AICRUDTools.safe_int(cursor.fetchone()[0])
-                
-                cursor.execute("SELECT COUNT(*) as count FROM product")
-                product_count = AICRUDTools.safe_int(cursor.fetchone()[0])
-                
-                cursor.execute("SELECT COUNT(*) as count FROM users WHERE is_active = TRUE")
-                user_count = AICRUDTools.safe_int(cursor.fetchone()[0])
-                
-                cursor.execute("SELECT COUNT(*) as count FROM roles")
-                role_count = AICRUDTools.safe_int(cursor.fetchone()[0])
-                
-                # Low stock analysis
-                low_stock_products = AICRUDTools.get_low_stock_products()
-                low_stock_count = len(low_stock_products) if low_stock_products else 0
+                # Table sizes come from ANALYZE statistics where available; only
+                # tables missing from sqlite_stat1 fall back to a COUNT(*) scan
+                tables = _list_user_tables(cursor)
+                estimates = _table_row_estimates(cursor)
+                uncounted = [table for table in tables if table not in estimates]
+                
+                # All exact counts in one round trip
+                counts_query = """
+                    SELECT 'categories', COUNT(*) FROM product_category
+                    UNION ALL SELECT 'products', COUNT(*) FROM product
+                    UNION ALL SELECT 'active_users', COUNT(*) FROM users WHERE is_active = 1
+                    UNION ALL SELECT 'roles', COUNT(*) FROM roles
+                    UNION ALL SELECT 'low_stock', COUNT(*) FROM product WHERE stock_quantity < ?
+                """ + "".join(_table_count_sql[table] for table in uncounted)
+                cursor.execute(counts_query, (LOW_STOCK_THRESHOLD,))
+                counts = {label: AICRUDTools.safe_int(count) for label, count in cursor}
+                
+                category_count = counts['categories']
+                product_count = counts['products']
+                user_count = counts['active_users']
+                role_count = counts['roles']
+                low_stock_count = counts['low_stock']
+                table_sizes = {
+                    table: estimates[table] if table in estimates else counts[f'table:{table}']
+                    for table in tables
+                }
                 
                 # Database health check
                 cursor.execute("PRAGMA integrity_check")
                 db_health_result = cursor.fetchone()
                 db_health = db_health_result[0] if db_health_result else "unknown"
                 
-                # Table sizes
-                cursor.execute("""
-                    SELECT name FROM sqlite_master 
-                    WHERE type='table' AND name NOT LIKE 'sqlite_%'
-                """)
-                tables = [row[0] for row in cursor.fetchall()]
-                
-                table_sizes = {}
-                for table in tables:
-                    cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
-                    table_sizes[table] = AICRUDTools.safe_int(cursor.fetchone()[0])
-                
                 # Calculate health score
                 health_indicators = {
                     'categories': category_count > 0,
@@ -486,55 +567,20 @@ class AICRUDTools:
             }
     
     @staticmethod
+    @_ttl_cached
     def get_category_insights() -> Dict[str, Any]:
         """Get insights about product categories"""
         try:
-            with get_db_connection() as conn:
+            with get_db_connection_ro() as conn:
                 cursor = conn.cursor()
                 
                 # Categories with most products
-                cursor.execute("""
-                    SELECT 
-                        pc.category_id,
-                        pc.subcategory_id,
-                        pc.category_name,
-                        COUNT(p.product_id) as product_count,
-                        AVG(p.price) as avg_price,
-                        SUM(p.stock_quantity) as total_stock
-                    FROM product_category pc
-                    LEFT JOIN product p ON pc.category_id = p.category_id AND pc.subcategory_id = p.subcategory_id
-                    GROUP BY pc.category_id, pc.subcategory_id, pc.category_name
-                    ORDER BY product_count DESC
-                """)
-                category_insights = []
-                for row in cursor.fetchall():
-                    insight = dict(row)
-                    # Safe conversion
-                    if 'avg_price' in insight:
-                        insight['avg_price'] = AICRUDTools.safe_float(insight['avg_price'])
-                    if 'total_stock' in insight:
-                        insight['total_stock'] = AICRUDTools.safe_int(insight['total_stock'])
-                    if 'product_count' in insight:
-                        insight['product_count'] = AICRUDTools.safe_int(insight['product_count'])
-                    category_insights.append(insight)
+                cursor.execute(_CATEGORY_INSIGHTS_SQL)
+                category_insights = [dict(row) for row in cursor]
                 
                 # Categories with low stock
-                cursor.execute("""
-                    SELECT 
-                        pc.category_name,
-                        COUNT(p.product_id) as low_stock_count
-                    FROM product_category pc
-                    JOIN product p ON pc.category_id = p.category_id AND pc.subcategory_id = p.subcategory_id
-                    WHERE p.stock_quantity < 10
-                    GROUP BY pc.category_name
-                    ORDER BY low_stock_count DESC
-                """)
-                low_stock_categories = []
-                for row in cursor.fetchall():
-                    category_dict = dict(row)
-                    if 'low_stock_count' in category_dict:
-                        category_dict['low_stock_count'] = AICRUDTools.safe_int(category_dict['low_stock_count'])
-                    low_stock_categories.append(category_dict)
+                cursor.execute(_LOW_STOCK_CATEGORIES_SQL, (LOW_STOCK_THRESHOLD,))
+                low_stock_categories = [dict(row) for row in cursor]
                 
                 # Calculate statistics safely
                 total_categories = len(category_insights)
@@ -558,4 +604,19 @@ class AICRUDTools:
                 "categories_with_products": 0,
                 "empty_categories": 0,
                 "error": str(e)
-            }
\ No newline at end of file
+            }
+
+# Numeric product columns and how to coerce them; aggregate queries
+# coerce their own results in SQL with COALESCE/CAST
+_COLUMN_CASTERS = {
+    'price': AICRUDTools.safe_float,
+    'stock_quantity': AICRUDTools.safe_int,
+}
+
+def _rows_to_dicts(cursor) -> List[Dict]:
+    """Stream the cursor's rows into dicts, coercing numeric columns by name"""
+    columns = [(col[0], _COLUMN_CASTERS.get(col[0])) for col in cursor.description]
+    return [
+        {name: (caster(value) if caster else value) for (name, caster), value in zip(columns, row)}
+        for row in cursor
+    ]
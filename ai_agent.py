@@ -1,100 +1,178 @@
+import asyncio
+import atexit
 import logging
-import time
 import json
-from typing import Dict, Any, List, Optional
+import re
+import traceback
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Optional
 from agent_tools import AICRUDTools
 
 logger = logging.getLogger(__name__)
 
+# Routing keywords for get_relevant_data, grouped by the data they select
+_ROUTING_KEYWORDS = {
+    'product': ('product', 'inventory', 'stock'),
+    'low': ('low', 'out of stock'),
+    'category': ('category', 'categories'),
+    'analytics': ('analytics', 'trend', 'report', 'statistics'),
+    'user': ('user', 'users'),
+    'health': ('health', 'status', 'system'),
+}
+_KEYWORD_GROUPS = {}
+for _group, _keywords in _ROUTING_KEYWORDS.items():
+    for _keyword in _keywords:
+        _KEYWORD_GROUPS.setdefault(_keyword, set()).add(_group)
+
+# One pass over the input finds every keyword: the lookahead tries all of
+# them at each position, longest first, so overlapping keywords still match
+_KEYWORD_PATTERN = re.compile(
+    "(?=(" + "|".join(map(re.escape, sorted(_KEYWORD_GROUPS, key=len, reverse=True))) + "))"
+)
+
+def _keyword_groups(text: str) -> set:
+    """Return the routing groups whose keywords occur in already-lowercased text"""
+    groups = set()
+    for keyword in _KEYWORD_PATTERN.findall(text):
+        groups |= _KEYWORD_GROUPS[keyword]
+    return groups
+
+# Last resort for model entries that only expose a repr
+_MODEL_REPR_NAME = re.compile(r"model='([^']*)'")
+
+def _model_name(model) -> Optional[str]:
+    """Name of one entry from Ollama's model list"""
+    if isinstance(model, str):
+        return model.split()[0] if model.strip() else None
+    name = getattr(model, 'model', None) or getattr(model, 'name', None)
+    if not name and isinstance(model, dict):
+        name = model.get('model') or model.get('name')
+    if not name:
+        match = _MODEL_REPR_NAME.search(str(model))
+        name = match.group(1) if match else None
+    return name
+
+_QUERY_PROMPT = """
+            You are a helpful AI assistant for a business inventory management system.
+            
+            User Role: {user_role}
+            User Query: {user_input}
+            
+            Available data and functions:
+            - Product inventory and categories
+            - Sales trends and analytics
+            - User management (if admin/manager)
+            - System health monitoring
+            
+            Please provide a helpful, concise response. If the user is asking about data you can't access,
+            suggest what they can do with their current permissions.
+            
+            Response:
+            """
+
+# Fixed replies for when the model can't be reached; read-only so they can be shared
+_UNAVAILABLE_RESPONSE = MappingProxyType({
+    "response": "🔧 AI Assistant is currently unavailable.\n\nPlease ensure:\n1. Ollama is running: `ollama serve`\n2. Models are available: `ollama list`\n3. Restart the application\n\nIf issues persist, check the server logs for detailed error information.",
+    "data": MappingProxyType({}),
+    "reasoning": "AI service not available",
+    "action_taken": "unavailable",
+    "needs_human_review": True
+})
+
+_FALLBACK_RESPONSE = MappingProxyType({
+    "response": "🔧 AI Assistant is currently unavailable. Please check:\n1. Ollama service is running\n2. Models are available via `ollama list`\n3. Restart the application",
+    "data": MappingProxyType({}),
+    "reasoning": "Fallback agent - initialization failed",
+    "action_taken": "fallback",
+    "needs_human_review": True
+})
+
 class AIAgent:
     def __init__(self, model: str = "llama3.1:latest"):
-        self.model = model
+        self._set_model(model)
         self.available = False
         self.client = None
+        self.async_client = None
+        self._probed = False
+        self._probe_lock = None
         
         try:
             logger.info("🚀 Initializing AI Agent...")
             import ollama
-            self.client = ollama.Client()
-            
-            # Test the connection
-            self.test_ollama_connection()
+            import httpx
+            # The sync client probes Ollama at startup; requests go through the
+            # async client so a slow generation doesn't block the event loop.
+            # Set OLLAMA_NUM_PARALLEL on the Ollama server to let it serve
+            # several of these concurrently.
+            # Both clients keep a tuned keep-alive pool for their lifetime.
+            # Ollama serves plain-text HTTP/1.1, so HTTP/2 isn't an option here.
+            limits = httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30)
+            timeout = httpx.Timeout(300.0, connect=10.0)
+            sync_transport = httpx.HTTPTransport(retries=3, limits=limits)
+            self.client = ollama.Client(timeout=timeout, transport=sync_transport)
+            self.async_client = ollama.AsyncClient(
+                timeout=timeout,
+                transport=httpx.AsyncHTTPTransport(retries=3, limits=limits)
+            )
+            atexit.register(sync_transport.close)
             
         except ImportError:
             logger.error("❌ Ollama package not installed. Run: pip install ollama")
-            self.available = False
+            self._probed = True
         except Exception as e:
             logger.error(f"❌ Failed to initialize Ollama client: {e}")
-            self.available = False
+            self._probed = True
+
+    async def ensure_ready(self):
+        """Probe Ollama on first use rather than at import, so startup stays fast"""
+        if self._probed:
+            return
+        if self._probe_lock is None:
+            self._probe_lock = asyncio.Lock()
+        async with self._probe_lock:
+            if not self._probed:
+                # The probe uses the sync client; keep it off the event loop
+                await asyncio.to_thread(self.probe)
+                self._probed = True
+
+    def probe(self):
+        """Check that Ollama is reachable and pick the model to use"""
+        self.test_ollama_connection()
 
+    def _set_model(self, name: str):
+        """Record the model name, sanitized once for every later generate call"""
+        self.model = name
+        self._clean_model = name.strip().strip("'\"")
+    
     def test_ollama_connection(self):
         """Test connection to Ollama with proper model name extraction"""
         try:
             # Get model list
             models_response = self.client.list()
-            logger.info(f"📋 Raw models response type: {type(models_response)}")
+            logger.debug(f"📋 Raw models response type: {type(models_response)}")
             
             # Handle ListResponse object
             models = []
             if hasattr(models_response, 'models'):
                 models = models_response.models
-                logger.info(f"📋 Using models from .models attribute, count: {len(models)}")
+                logger.debug(f"📋 Using models from .models attribute, count: {len(models)}")
             elif isinstance(models_response, list):
                 models = models_response
-                logger.info(f"📋 Using models as plain list, count: {len(models)}")
+                logger.debug(f"📋 Using models as plain list, count: {len(models)}")
             elif isinstance(models_response, dict) and 'models' in models_response:
                 models = models_response['models']
-                logger.info(f"📋 Using models from dict key, count: {len(models)}")
+                logger.debug(f"📋 Using models from dict key, count: {len(models)}")
             else:
                 logger.warning(f"⚠️ Unexpected models response format: {type(models_response)}")
                 models = []
             
-            logger.info(f"📋 Final models count: {len(models)}")
+            logger.debug(f"📋 Final models count: {len(models)}")
             
-            # Extract model names from the models list - CRITICAL FIX HERE
-            available_models = []
-            for i, model in enumerate(models):
-                try:
-                    model_name = None
-                    
-                    # Method 1: Check for model attribute (most common)
-                    if hasattr(model, 'model') and model.model:
-                        model_name = model.model
-                        logger.info(f"  ✅ Model {i} name from .model: {model_name}")
-                    
-                    # Method 2: Check for name attribute
-                    elif hasattr(model, 'name') and model.name:
-                        model_name = model.name
-                        logger.info(f"  ✅ Model {i} name from .name: {model_name}")
-                    
-                    # Method 3: If it's a dict, get from 'model' or 'name' key
-                    elif isinstance(model, dict):
-                        model_name = model.get('model') or model.get('name')
-                        if model_name:
-                            logger.info(f"  ✅ Model {i} name from dict: {model_name}")
-                    
-                    # Method 4: Last resort - string representation
-                    if not model_name:
-                        model_str = str(model)
-                        # Try to extract model name from string representation
-                        if "model='" in model_str:
-                            import re
-                            match = re.search(r"model='([^']*)'", model_str)
-                            if match:
-                                model_name = match.group(1)
-                                logger.info(f"  ✅ Model {i} name extracted from string: {model_name}")
-                        else:
-                            model_name = model_str.split()[0] if model_str else f"unknown_{i}"
-                            logger.info(f"  ⚠️ Model {i} name from string fallback: {model_name}")
-                    
-                    if model_name:
-                        available_models.append(model_name)
-                    else:
-                        logger.warning(f"  ❌ Could not extract model name for model {i}")
-                        
-                except Exception as e:
-                    logger.error(f"❌ Error processing model {i}: {e}")
-                    continue
+            # Extract model names: attribute access covers the SDK's typed
+            # responses, dict keys cover older versions
+            available_models = [name for name in map(_model_name, models) if name]
+            if logger.isEnabledFor(logging.DEBUG) and len(available_models) < len(models):
+                logger.debug(f"Could not extract names for {len(models) - len(available_models)} model(s)")
             
             logger.info(f"📋 Available model names: {available_models}")
             
@@ -120,7 +198,7 @@ class AIAgent:
                     break
             
             if target_model_found and actual_model_name:
-                self.model = actual_model_name
+                self._set_model(actual_model_name)
                 logger.info(f"🎯 Final model to use: '{self.model}'")
                 self.available = True
                 
@@ -133,7 +211,7 @@ class AIAgent:
                 
                 # Try to use any available model
                 if available_models:
-                    self.model = available_models[0].strip().strip("'\"")
+                    self._set_model(available_models[0])
                     logger.info(f"🔄 Using first available model: '{self.model}'")
                     self.available = True
                     self.test_model_generation()
@@ -143,33 +221,25 @@ class AIAgent:
                         
         except Exception as e:
             logger.error(f"❌ Error testing Ollama connection: {e}")
-            import traceback
             logger.error(f"❌ Traceback: {traceback.format_exc()}")
             self.available = False
 
     def test_model_generation(self):
-        """Test if the selected model can generate responses"""
+        """Check the selected model loads, with a one-token handshake"""
         try:
-            logger.info(f"🧪 Testing model generation with: '{self.model}'")
+            logger.info(f"🧪 Testing model generation with: '{self._clean_model}'")
             
-            # Ensure we're using a clean model name
-            clean_model = self.model.strip().strip("'\"")
-            logger.info(f"🧪 Using clean model name: '{clean_model}'")
-            
-            test_response = self.client.generate(
-                model=clean_model,
-                prompt="Hello, please respond with 'AI Agent is working' to confirm everything is working.",
+            # A single predicted token is enough to prove the weights load;
+            # decoding a full sentence only added seconds to startup
+            self.client.generate(
+                model=self._clean_model,
+                prompt=" ",
                 stream=False,
-                options={'timeout': 60000}  # 1 minute timeout for test
+                options={'num_predict': 1, 'temperature': 0}
             )
             
-            if test_response and 'response' in test_response:
-                response_text = test_response['response'].strip()
-                logger.info(f"✅ Model test successful! Response: '{response_text}'")
-                self.available = True
-            else:
-                logger.warning("⚠️ Model test: Empty response received")
-                self.available = False
+            logger.info("✅ Model handshake successful!")
+            self.available = True
                 
         except Exception as e:
             logger.error(f"❌ Model generation test failed: {e}")
@@ -178,20 +248,19 @@ class AIAgent:
     def is_available(self):
         return self.available
 
-    def safe_generate(self, prompt: str, max_retries: int = 2) -> str:
+    async def safe_generate(self, prompt: str, max_retries: int = 2) -> str:
         """Generate response with comprehensive error handling"""
-        if not self.available or not self.client:
+        await self.ensure_ready()
+        if not self.available or not self.async_client:
             return "AI service is currently unavailable. Please check if Ollama is running."
         
         for attempt in range(max_retries):
             try:
-                logger.info(f"🤖 Generating response (attempt {attempt + 1}) with model: '{self.model}'")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(f"🤖 Generating response (attempt {attempt + 1}) with model: '{self.model}'")
                 
-                # Use clean model name
-                clean_model = self.model.strip().strip("'\"")
-                
-                response = self.client.generate(
-                    model=clean_model,
+                response = await self.async_client.generate(
+                    model=self._clean_model,
                     prompt=prompt,
                     stream=False,
                     options={
@@ -211,41 +280,27 @@ class AIAgent:
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 5
                     logger.info(f"⏳ Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
+                    await asyncio.sleep(wait_time)
                 else:
                     logger.error(f"💥 All generation attempts failed")
         
         return "I apologize, but I'm having trouble generating a response right now. Please try again later or check the Ollama service."
 
-    def process_query(self, user_input: str, user_role: str = "user") -> Dict[str, Any]:
+    async def process_query(self, user_input: str, user_role: str = "user") -> Dict[str, Any]:
         """Process user queries with the AI agent"""
+        await self.ensure_ready()
         if not self.available:
             return self.get_unavailable_response()
         
         try:
             # Enhanced prompt for better responses
-            prompt = f"""
-            You are a helpful AI assistant for a business inventory management system.
+            prompt = _QUERY_PROMPT.format_map({"user_role": user_role, "user_input": user_input})
             
-            User Role: {user_role}
-            User Query: {user_input}
-            
-            Available data and functions:
-            - Product inventory and categories
-            - Sales trends and analytics
-            - User management (if admin/manager)
-            - System health monitoring
-            
-            Please provide a helpful, concise response. If the user is asking about data you can't access,
-            suggest what they can do with their current permissions.
-            
-            Response:
-            """
-            
-            response_text = self.safe_generate(prompt)
-            
-            # Get relevant data based on query type
-            data = self.get_relevant_data(user_input, user_role)
+            # Generate while the relevant data is fetched on a worker thread
+            response_text, data = await asyncio.gather(
+                self.safe_generate(prompt),
+                asyncio.to_thread(self.get_relevant_data, user_input, user_role)
+            )
             
             return {
                 "response": response_text,
@@ -271,28 +326,30 @@ class AIAgent:
         data = {}
         
         try:
+            groups = _keyword_groups(user_input_lower)
+            
             # Product-related queries
-            if any(keyword in user_input_lower for keyword in ['product', 'inventory', 'stock']):
-                if 'low' in user_input_lower or 'out of stock' in user_input_lower:
+            if 'product' in groups:
+                if 'low' in groups:
                     data['low_stock'] = AICRUDTools.get_low_stock_products()
                 else:
                     data['products'] = AICRUDTools.search_products(user_input)
             
             # Category-related queries
-            elif any(keyword in user_input_lower for keyword in ['category', 'categories']):
+            elif 'category' in groups:
                 data['categories'] = AICRUDTools.get_category_insights()
             
             # Analytics queries
-            elif any(keyword in user_input_lower for keyword in ['analytics', 'trend', 'report', 'statistics']):
+            elif 'analytics' in groups:
                 data['trends'] = AICRUDTools.get_sales_trends()
                 data['system_health'] = AICRUDTools.get_system_health()
             
             # User-related queries (only for admin/manager)
-            elif any(keyword in user_input_lower for keyword in ['user', 'users']) and user_role in ['admin', 'manager']:
+            elif 'user' in groups and user_role in ['admin', 'manager']:
                 data['user_analytics'] = AICRUDTools.analyze_user_behavior()
             
             # System health queries
-            elif any(keyword in user_input_lower for keyword in ['health', 'status', 'system']):
+            elif 'health' in groups:
                 data['system_health'] = AICRUDTools.get_system_health()
                 
         except Exception as e:
@@ -301,31 +358,18 @@ class AIAgent:
         
         return data
 
-    def get_unavailable_response(self) -> Dict[str, Any]:
+    def get_unavailable_response(self) -> Mapping[str, Any]:
         """Get response when AI service is unavailable"""
-        return {
-            "response": "🔧 AI Assistant is currently unavailable.\n\nPlease ensure:\n1. Ollama is running: `ollama serve`\n2. Models are available: `ollama list`\n3. Restart the application\n\nIf issues persist, check the server logs for detailed error information.",
-            "data": {},
-            "reasoning": "AI service not available",
-            "action_taken": "unavailable",
-            "needs_human_review": True
-        }
+        return _UNAVAILABLE_RESPONSE
 
 # Create agent instance with comprehensive error handling
 try:
     logger.info("🚀 Initializing AI Agent...")
     ai_agent = AIAgent(model="llama3.1:latest")
-    
-    if ai_agent.is_available():
-        logger.info("✅ AI Agent initialized successfully!")
-        logger.info(f"📋 Using model: '{ai_agent.model}'")
-    else:
-        logger.warning("⚠️ AI Agent initialized but not available")
-        logger.warning("💡 Please check Ollama installation and model availability")
+    logger.info("✅ AI Agent created; Ollama is probed on the first request")
         
 except Exception as e:
     logger.error(f"💥 Failed to initialize AI Agent: {e}")
-    import traceback
     logger.error(f"💥 Traceback: {traceback.format_exc()}")
     
     # Create fallback agent
@@ -336,14 +380,11 @@ except Exception as e:
         
         def is_available(self):
             return False
+        
+        async def ensure_ready(self):
+            pass
             
-        def process_query(self, user_input, user_role="user"):
-            return {
-                "response": "🔧 AI Assistant is currently unavailable. Please check:\n1. Ollama service is running\n2. Models are available via `ollama list`\n3. Restart the application",
-                "data": {},
-                "reasoning": "Fallback agent - initialization failed",
-                "action_taken": "fallback",
-                "needs_human_review": True
-            }
+        async def process_query(self, user_input, user_role="user"):
+            return _FALLBACK_RESPONSE
     
     ai_agent = FallbackAgent()
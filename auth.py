@@ -1,18 +1,68 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from argon2 import PasswordHasher
+from argon2 import PasswordHasher, Type, extract_parameters
 from argon2.exceptions import VerifyMismatchError, InvalidHashError
 from schemas import CRUDException
+import hashlib
+import os
 import secrets
+import threading
+import time
 
-# Generate a secure secret key
-SECRET_KEY = secrets.token_urlsafe(32)
+SECRET_KEY_FILE = os.path.join(os.path.expanduser("~"), ".aibi", "secret.key")
+
+def _load_or_create_key(path: str) -> str:
+    """Read the signing key from path, creating it (mode 0600) on first run"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a private temp file, then link it into place: os.link fails
+        # if another worker got there first, in which case we use theirs
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(secrets.token_urlsafe(32))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError as e:
+        print(f"⚠️ Could not persist secret key ({e}); tokens will not survive a restart")
+        return secrets.token_urlsafe(32)
+
+# Signing key shared by every worker and kept across restarts
+SECRET_KEY = os.environ.get("AIBI_SECRET_KEY") or _load_or_create_key(SECRET_KEY_FILE)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing with Argon2
-ph = PasswordHasher()
+# Password hashing with Argon2id at the library's default cost (3 passes,
+# 64 MiB, 4 lanes). The environment can raise these but never lower them.
+# PasswordHasher keeps no per-call state, so one instance serves every thread.
+_default_ph = PasswordHasher()
+ph = PasswordHasher(
+    time_cost=max(int(os.getenv("ARGON2_TIME", 0)), _default_ph.time_cost),
+    memory_cost=max(int(os.getenv("ARGON2_MEM_KIB", 0)), _default_ph.memory_cost),
+    parallelism=max(int(os.getenv("ARGON2_PAR", 0)), _default_ph.parallelism),
+    type=Type.ID
+)
+
+# Verified token payloads keyed by sha256(token), evicted LRU-first or at expiry
+TOKEN_CACHE_SIZE = 4096
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
 
 class AuthHandler:
     @staticmethod
@@ -28,6 +78,22 @@ class AuthHandler:
             print(f"❌ Password verification error: {e}")
             return False
 
+    @staticmethod
+    def password_needs_rehash(hashed_password):
+        """True when a stored hash is cheaper than the current Argon2 parameters"""
+        try:
+            stored = extract_parameters(hashed_password)
+        except Exception:
+            return False
+        # check_needs_rehash also fires on stronger hashes, which would
+        # downgrade them on every login; only ever move the cost up
+        return (
+            stored.type != Type.ID
+            or stored.time_cost < ph.time_cost
+            or stored.memory_cost < ph.memory_cost
+            or stored.parallelism < ph.parallelism
+        )
+
     @staticmethod
     def get_password_hash(password):
         try:
@@ -53,8 +119,25 @@ class AuthHandler:
 
     @staticmethod
     def verify_token(token: str):
+        key = hashlib.sha256(token.encode()).digest()
+        with _token_cache_lock:
+            cached = _token_cache.get(key)
+            if cached is not None:
+                payload, expires_at = cached
+                if time.time() < expires_at:
+                    _token_cache.move_to_end(key)
+                    return dict(payload)
+                del _token_cache[key]
+        
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            # Only tokens with an expiry are cached, and never past it
+            expires_at = payload.get("exp")
+            if isinstance(expires_at, (int, float)):
+                with _token_cache_lock:
+                    _token_cache[key] = (dict(payload), expires_at)
+                    if len(_token_cache) > TOKEN_CACHE_SIZE:
+                        _token_cache.popitem(last=False)
             return payload
         except JWTError:
             return None
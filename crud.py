@@ -1,87 +1,122 @@
-from database import get_db_connection
+import sqlite3
+from database import begin_read, begin_write
 from models import ProductCategoryCreate, ProductCategoryUpdate, ProductCreate, ProductUpdate
 from schemas import CRUDException
 from typing import List, Optional, Tuple
 
+# Fixed statements with explicit columns; identical SQL text lets each
+# pooled connection reuse its prepared statements. Writes lean on the table's
+# PRIMARY KEY / UNIQUE / FOREIGN KEY constraints instead of checking first;
+# the checks below only run to explain a rejected write.
+SQL_CATEGORY_EXISTS = "SELECT 1 FROM product_category WHERE category_id = ? AND subcategory_id = ?"
+SQL_CATEGORY_NAME_EXISTS = "SELECT 1 FROM product_category WHERE category_name = ?"
+SQL_INSERT_CATEGORY = "INSERT INTO product_category (category_id, subcategory_id, category_name, description) VALUES (?, ?, ?, ?)"
+SQL_GET_CATEGORY = "SELECT category_id, subcategory_id, category_name, description FROM product_category WHERE category_id = ? AND subcategory_id = ?"
+SQL_ALL_CATEGORIES = "SELECT category_id, subcategory_id, category_name, description FROM product_category"
+SQL_DELETE_CATEGORY = "DELETE FROM product_category WHERE category_id = ? AND subcategory_id = ?"
+
+_PRODUCT_COLUMNS = "product_id, category_id, subcategory_id, product_name, price, stock_quantity"
+SQL_PRODUCT_EXISTS = "SELECT 1 FROM product WHERE product_id = ?"
+SQL_PRODUCT_NAME_EXISTS = "SELECT 1 FROM product WHERE product_name = ?"
+SQL_INSERT_PRODUCT = "INSERT INTO product (category_id, subcategory_id, product_name, price, stock_quantity) VALUES (?, ?, ?, ?, ?)"
+SQL_GET_PRODUCT = f"SELECT {_PRODUCT_COLUMNS} FROM product WHERE product_id = ?"
+SQL_PRODUCTS_BY_CATEGORY = f"SELECT {_PRODUCT_COLUMNS} FROM product WHERE category_id = ? AND subcategory_id = ?"
+SQL_ALL_PRODUCTS = """
+    SELECT p.product_id, p.product_name, p.price, p.stock_quantity, p.category_id, p.subcategory_id, pc.category_name
+    FROM product p 
+    JOIN product_category pc ON p.category_id = pc.category_id AND p.subcategory_id = pc.subcategory_id
+"""
+SQL_DELETE_PRODUCT = "DELETE FROM product WHERE product_id = ?"
+
+def _category_conflict(cursor, categories) -> Optional[CRUDException]:
+    """Explain why inserting these categories broke a constraint"""
+    seen_keys, seen_names = set(), set()
+    for category in categories:
+        key = (category.category_id, category.subcategory_id)
+        cursor.execute(SQL_CATEGORY_EXISTS, key)
+        if key in seen_keys or cursor.fetchone():
+            return CRUDException("Category with this ID already exists", 400)
+        cursor.execute(SQL_CATEGORY_NAME_EXISTS, (category.category_name,))
+        if category.category_name in seen_names or cursor.fetchone():
+            return CRUDException("Category name already exists. Please use a unique category name.", 400)
+        seen_keys.add(key)
+        seen_names.add(category.category_name)
+    return None
+
+def _product_conflict(cursor, products) -> Optional[CRUDException]:
+    """Explain why inserting these products broke a constraint"""
+    seen_names = set()
+    for product in products:
+        cursor.execute(SQL_CATEGORY_EXISTS, (product.category_id, product.subcategory_id))
+        if not cursor.fetchone():
+            return CRUDException("Referenced category not found", 400)
+        cursor.execute(SQL_PRODUCT_NAME_EXISTS, (product.product_name,))
+        if product.product_name in seen_names or cursor.fetchone():
+            return CRUDException("Product name already exists. Please use a unique product name.", 400)
+        seen_names.add(product.product_name)
+    return None
+
+def _rows_to_dicts(cursor) -> List[dict]:
+    """Row dicts, with column names captured once per result set
+    
+    Works on tuples or sqlite3.Row; the listings read tuple rows.
+    """
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
 class ProductCategoryCRUD:
     @staticmethod
-    def create_category(category: ProductCategoryCreate) -> dict:
+    def create_category(category: ProductCategoryCreate, conn=None) -> dict:
         """Create a new product category"""
-        with get_db_connection() as conn:
+        return ProductCategoryCRUD.create_categories_bulk([category], conn)[0]
+    
+    @staticmethod
+    def create_categories_bulk(categories: List[ProductCategoryCreate], conn=None) -> List[dict]:
+        """Create several categories in one transaction; all or nothing"""
+        with begin_write(conn) as conn:
             cursor = conn.cursor()
             
-            # Check if category already exists
-            cursor.execute(
-                "SELECT * FROM product_category WHERE category_id = ? AND subcategory_id = ?",
-                (category.category_id, category.subcategory_id)
-            )
-            if cursor.fetchone():
-                raise CRUDException("Category with this ID already exists", 400)
-            
-            # NEW: Check if category name already exists
-            cursor.execute(
-                "SELECT * FROM product_category WHERE category_name = ?",
-                (category.category_name,)
-            )
-            if cursor.fetchone():
-                raise CRUDException("Category name already exists. Please use a unique category name.", 400)
-            
-            cursor.execute(
-                "INSERT INTO product_category (category_id, subcategory_id, category_name, description) VALUES (?, ?, ?, ?)",
-                (category.category_id, category.subcategory_id, category.category_name, category.description)
-            )
-            conn.commit()
+            # begin_write holds the write lock; the whole batch commits with one sync
+            try:
+                cursor.executemany(
+                    SQL_INSERT_CATEGORY,
+                    [(c.category_id, c.subcategory_id, c.category_name, c.description) for c in categories]
+                )
+            except sqlite3.IntegrityError as e:
+                conn.rollback()
+                raise _category_conflict(cursor, categories) or CRUDException(f"Database error: {e}", 500)
             
-            return {**category.dict(), "message": "Category created successfully"}
+            return [{**category.dict(), "message": "Category created successfully"} for category in categories]
     
     @staticmethod
-    def get_category(category_id: int, subcategory_id: int) -> dict:
+    def get_category(category_id: int, subcategory_id: int, conn=None) -> dict:
         """Get category by composite key"""
-        with get_db_connection() as conn:
+        with begin_read(conn) as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM product_category WHERE category_id = ? AND subcategory_id = ?",
-                (category_id, subcategory_id)
-            )
+            cursor.execute(SQL_GET_CATEGORY, (category_id, subcategory_id))
             result = cursor.fetchone()
             if not result:
                 raise CRUDException("Category not found", 404)
             return dict(result)
     
     @staticmethod
-    def get_all_categories() -> List[dict]:
+    def get_all_categories(conn=None) -> List[dict]:
         """Get all categories"""
-        with get_db_connection() as conn:
+        with begin_read(conn, row_factory=None) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM product_category")
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute(SQL_ALL_CATEGORIES)
+            return _rows_to_dicts(cursor)
     
     @staticmethod
-    def update_category(category_id: int, subcategory_id: int, category: ProductCategoryUpdate) -> dict:
+    def update_category(category_id: int, subcategory_id: int, category: ProductCategoryUpdate, conn=None) -> dict:
         """Update category"""
-        with get_db_connection() as conn:
+        with begin_write(conn) as conn:
             cursor = conn.cursor()
             
-            # Check if category exists
-            cursor.execute(
-                "SELECT * FROM product_category WHERE category_id = ? AND subcategory_id = ?",
-                (category_id, subcategory_id)
-            )
-            if not cursor.fetchone():
-                raise CRUDException("Category not found", 404)
-            
             update_fields = []
             params = []
             
             if category.category_name is not None:
-                # NEW: Check if new category name already exists (excluding current category)
-                cursor.execute(
-                    "SELECT * FROM product_category WHERE category_name = ? AND (category_id != ? OR subcategory_id != ?)",
-                    (category.category_name, category_id, subcategory_id)
-                )
-                if cursor.fetchone():
-                    raise CRUDException("Category name already exists. Please use a unique category name.", 400)
-                
                 update_fields.append("category_name = ?")
                 params.append(category.category_name)
             if category.description is not None:
@@ -89,126 +124,105 @@ class ProductCategoryCRUD:
                 params.append(category.description)
             
             if not update_fields:
+                cursor.execute(SQL_CATEGORY_EXISTS, (category_id, subcategory_id))
+                if not cursor.fetchone():
+                    raise CRUDException("Category not found", 404)
                 raise CRUDException("No fields to update", 400)
             
             params.extend([category_id, subcategory_id])
             query = f"UPDATE product_category SET {', '.join(update_fields)} WHERE category_id = ? AND subcategory_id = ?"
             
-            cursor.execute(query, params)
-            conn.commit()
+            try:
+                cursor.execute(query, params)
+            except sqlite3.IntegrityError:
+                # The UNIQUE constraint on category_name rejected the new name
+                raise CRUDException("Category name already exists. Please use a unique category name.", 400)
+            if cursor.rowcount == 0:
+                raise CRUDException("Category not found", 404)
             
             return {"message": "Category updated successfully"}
     
     @staticmethod
-    def delete_category(category_id: int, subcategory_id: int) -> dict:
+    def delete_category(category_id: int, subcategory_id: int, conn=None) -> dict:
         """Delete category (will cascade to products)"""
-        with get_db_connection() as conn:
+        with begin_write(conn) as conn:
             cursor = conn.cursor()
             
-            # Check if category exists
-            cursor.execute(
-                "SELECT * FROM product_category WHERE category_id = ? AND subcategory_id = ?",
-                (category_id, subcategory_id)
-            )
-            if not cursor.fetchone():
+            cursor.execute(SQL_DELETE_CATEGORY, (category_id, subcategory_id))
+            if cursor.rowcount == 0:
                 raise CRUDException("Category not found", 404)
             
-            cursor.execute(
-                "DELETE FROM product_category WHERE category_id = ? AND subcategory_id = ?",
-                (category_id, subcategory_id)
-            )
-            conn.commit()
-            
             return {"message": "Category deleted successfully"}
 
 class ProductCRUD:
     @staticmethod
-    def create_product(product: ProductCreate) -> dict:
+    def create_product(product: ProductCreate, conn=None) -> dict:
         """Create a new product"""
-        with get_db_connection() as conn:
+        return ProductCRUD.create_products_bulk([product], conn)[0]
+    
+    @staticmethod
+    def create_products_bulk(products: List[ProductCreate], conn=None) -> List[dict]:
+        """Create several products in one transaction; all or nothing"""
+        with begin_write(conn) as conn:
             cursor = conn.cursor()
             
-            # Check if category exists
-            cursor.execute(
-                "SELECT * FROM product_category WHERE category_id = ? AND subcategory_id = ?",
-                (product.category_id, product.subcategory_id)
-            )
-            if not cursor.fetchone():
-                raise CRUDException("Referenced category not found", 400)
-            
-            # NEW: Check if product name already exists
-            cursor.execute(
-                "SELECT * FROM product WHERE product_name = ?",
-                (product.product_name,)
-            )
-            if cursor.fetchone():
-                raise CRUDException("Product name already exists. Please use a unique product name.", 400)
-
-            cursor.execute(
-                "INSERT INTO product (category_id, subcategory_id, product_name, price, stock_quantity) VALUES (?, ?, ?, ?, ?)",
-                (product.category_id, product.subcategory_id, product.product_name, float(product.price), product.stock_quantity)
-            )
-            conn.commit()
-            
-            product_id = cursor.lastrowid
-            return {**product.dict(), "product_id": product_id, "message": "Product created successfully"}
+            # begin_write holds the write lock; the whole batch commits with one sync
+            try:
+                cursor.executemany(
+                    SQL_INSERT_PRODUCT,
+                    [(p.category_id, p.subcategory_id, p.product_name, float(p.price), p.stock_quantity) for p in products]
+                )
+            except sqlite3.IntegrityError as e:
+                conn.rollback()
+                raise _product_conflict(cursor, products) or CRUDException(f"Database error: {e}", 500)
+            
+            # Nobody else can write while we hold the lock, so the batch got consecutive ids
+            cursor.execute("SELECT last_insert_rowid()")
+            last_id = cursor.fetchone()[0]
+            
+            first_id = last_id - len(products) + 1
+            return [
+                {**product.dict(), "product_id": first_id + i, "message": "Product created successfully"}
+                for i, product in enumerate(products)
+            ]
     
     @staticmethod
-    def get_product(product_id: int) -> dict:
+    def get_product(product_id: int, conn=None) -> dict:
         """Get product by ID"""
-        with get_db_connection() as conn:
+        with begin_read(conn) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM product WHERE product_id = ?", (product_id,))
+            cursor.execute(SQL_GET_PRODUCT, (product_id,))
             result = cursor.fetchone()
             if not result:
                 raise CRUDException("Product not found", 404)
             return dict(result)
     
     @staticmethod
-    def get_products_by_category(category_id: int, subcategory_id: int) -> List[dict]:
+    def get_products_by_category(category_id: int, subcategory_id: int, conn=None) -> List[dict]:
         """Get all products for a category"""
-        with get_db_connection() as conn:
+        with begin_read(conn, row_factory=None) as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM product WHERE category_id = ? AND subcategory_id = ?",
-                (category_id, subcategory_id)
-            )
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute(SQL_PRODUCTS_BY_CATEGORY, (category_id, subcategory_id))
+            return _rows_to_dicts(cursor)
     
     @staticmethod
-    def get_all_products() -> List[dict]:
+    def get_all_products(conn=None) -> List[dict]:
         """Get all products"""
-        with get_db_connection() as conn:
+        with begin_read(conn, row_factory=None) as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT p.*, pc.category_name 
-                FROM product p 
-                JOIN product_category pc ON p.category_id = pc.category_id AND p.subcategory_id = pc.subcategory_id
-            """)
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute(SQL_ALL_PRODUCTS)
+            return _rows_to_dicts(cursor)
     
     @staticmethod
-    def update_product(product_id: int, product: ProductUpdate) -> dict:
+    def update_product(product_id: int, product: ProductUpdate, conn=None) -> dict:
         """Update product"""
-        with get_db_connection() as conn:
+        with begin_write(conn) as conn:
             cursor = conn.cursor()
             
-            # Check if product exists
-            cursor.execute("SELECT * FROM product WHERE product_id = ?", (product_id,))
-            if not cursor.fetchone():
-                raise CRUDException("Product not found", 404)
-            
             update_fields = []
             params = []
             
             if product.product_name is not None:
-                # NEW: Check if new product name already exists (excluding current product)
-                cursor.execute(
-                    "SELECT * FROM product WHERE product_name = ? AND product_id != ?",
-                    (product.product_name, product_id)
-                )
-                if cursor.fetchone():
-                    raise CRUDException("Product name already exists. Please use a unique product name.", 400)
                 update_fields.append("product_name = ?")
                 params.append(product.product_name)
             if product.price is not None:
@@ -219,28 +233,32 @@ class ProductCRUD:
                 params.append(product.stock_quantity)
             
             if not update_fields:
+                cursor.execute(SQL_PRODUCT_EXISTS, (product_id,))
+                if not cursor.fetchone():
+                    raise CRUDException("Product not found", 404)
                 raise CRUDException("No fields to update", 400)
             
             params.append(product_id)
             query = f"UPDATE product SET {', '.join(update_fields)} WHERE product_id = ?"
             
-            cursor.execute(query, params)
-            conn.commit()
+            try:
+                cursor.execute(query, params)
+            except sqlite3.IntegrityError:
+                # The UNIQUE constraint on product_name rejected the new name
+                raise CRUDException("Product name already exists. Please use a unique product name.", 400)
+            if cursor.rowcount == 0:
+                raise CRUDException("Product not found", 404)
             
             return {"message": "Product updated successfully"}
     
     @staticmethod
-    def delete_product(product_id: int) -> dict:
+    def delete_product(product_id: int, conn=None) -> dict:
         """Delete product"""
-        with get_db_connection() as conn:
+        with begin_write(conn) as conn:
             cursor = conn.cursor()
             
-            # Check if product exists
-            cursor.execute("SELECT * FROM product WHERE product_id = ?", (product_id,))
-            if not cursor.fetchone():
+            cursor.execute(SQL_DELETE_PRODUCT, (product_id,))
+            if cursor.rowcount == 0:
                 raise CRUDException("Product not found", 404)
             
-            cursor.execute("DELETE FROM product WHERE product_id = ?", (product_id,))
-            conn.commit()
-            
             return {"message": "Product deleted successfully"}
\ No newline at end of file
@@ -1,96 +1,359 @@
 import sqlite3
 from contextlib import contextmanager
 import os
+import queue
+from urllib.request import pathname2url
 
 DATABASE_URL = "crud_app.db"
 
+# Warm connections kept for reuse by get_pooled_connection(); readers get
+# their own read-only pool so they never go through the write path
+POOL_SIZE = 8
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_read_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+# STRICT tables (SQLite 3.37+) reject mistyped values instead of silently storing them
+_HAS_STRICT = sqlite3.sqlite_version_info >= (3, 37, 0)
+TABLE_OPTIONS = "STRICT" if _HAS_STRICT else ""
+KEYED_TABLE_OPTIONS = "WITHOUT ROWID, STRICT" if _HAS_STRICT else "WITHOUT ROWID"
+
+# Stored in PRAGMA user_version; every schema change is a numbered step in
+# SCHEMA_STEPS and this is the number of the last one
+SCHEMA_VERSION = 3
+
+SQL_INSERT_ROLE = "INSERT OR IGNORE INTO roles (role_id, role_name, description) VALUES (?, ?, ?)"
+DEFAULT_ROLES = [
+    (1, 'admin', 'Full system access'),
+    (2, 'manager', 'Manage products and categories'),
+    (3, 'user', 'Read-only access')
+]
+
+# Current column definitions and options of each table, in creation order;
+# migration steps rebuild tables from these so they end up identical to fresh ones
+TABLES = {
+    'roles': ("""
+        role_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        role_name TEXT UNIQUE NOT NULL,
+        description TEXT
+    """, TABLE_OPTIONS),
+    # Master table - Product Category (composite primary key)
+    # WITHOUT ROWID stores rows in the primary key B-Tree itself, so there
+    # is no hidden rowid and no separate PK index to maintain
+    'product_category': ("""
+        category_id INTEGER NOT NULL,
+        subcategory_id INTEGER NOT NULL,
+        category_name TEXT UNIQUE NOT NULL,
+        description TEXT,
+        PRIMARY KEY (category_id, subcategory_id)
+    """, KEYED_TABLE_OPTIONS),
+    # Detail table - Product (foreign key to master)
+    # Category deletes cascade through idx_product_cat_cover's (category_id,
+    # subcategory_id) prefix, so they seek the affected products, not scan
+    'product': ("""
+        product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER NOT NULL,
+        subcategory_id INTEGER NOT NULL,
+        product_name TEXT UNIQUE NOT NULL,
+        price REAL NOT NULL,
+        stock_quantity INTEGER NOT NULL,
+        FOREIGN KEY (category_id, subcategory_id) 
+        REFERENCES product_category(category_id, subcategory_id)
+        ON DELETE CASCADE
+    """, TABLE_OPTIONS),
+    'users': ("""
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        hashed_password TEXT NOT NULL,
+        full_name TEXT,
+        role_id INTEGER NOT NULL DEFAULT 3, -- Default to 'user' role
+        is_active INTEGER DEFAULT 1 CHECK (is_active IN (0, 1)),
+        created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)), -- unix seconds
+        FOREIGN KEY (role_id) REFERENCES roles(role_id)
+    """, TABLE_OPTIONS),
+}
+
+INDEXES = [
+    # Covering index so the per-category aggregates never touch the table rows
+    """CREATE INDEX IF NOT EXISTS idx_product_cat_cover
+       ON product(category_id, subcategory_id, price, stock_quantity)""",
+    # FK index for role joins; product's FK is already the prefix of idx_product_cat_cover
+    """CREATE INDEX IF NOT EXISTS idx_users_role
+       ON users(role_id)""",
+    # Partial index so active-user counts read only the active entries
+    """CREATE INDEX IF NOT EXISTS idx_users_active
+       ON users(is_active) WHERE is_active = 1""",
+]
+
+# SELECT list that copies an older version of each table into its current
+# definition, column for column
+TABLE_COPY_COLUMNS = {
+    'roles': "role_id, role_name, description",
+    'product_category': "category_id, subcategory_id, category_name, description",
+    'product': """
+        product_id, category_id, subcategory_id, product_name,
+        CAST(price AS REAL), CAST(stock_quantity AS INTEGER)
+    """,
+    'users': """
+        id, username, email, hashed_password, full_name, role_id,
+        CASE WHEN is_active THEN 1 ELSE 0 END,
+        CASE WHEN typeof(created_at) = 'integer' THEN created_at
+             ELSE COALESCE(CAST(strftime('%s', created_at) AS INTEGER),
+                           CAST(strftime('%s', 'now') AS INTEGER)) END
+    """,
+}
+
+def _create_table_sql(name, table_name=None):
+    columns, options = TABLES[name]
+    return f"CREATE TABLE IF NOT EXISTS {table_name or name} ({columns}) {options}"
+
+def _table_body(sql):
+    """Column list and options of a CREATE TABLE statement, whitespace-normalized"""
+    return " ".join(sql[sql.index("("):].split())
+
+def _rebuild_table(cursor, name):
+    """Copy `name` into its current definition from TABLES"""
+    cursor.execute(_create_table_sql(name, f"{name}_new"))
+    cursor.execute(f"INSERT INTO {name}_new SELECT {TABLE_COPY_COLUMNS[name]} FROM {name}")
+    cursor.execute(f"DROP TABLE {name}")
+    cursor.execute(f"ALTER TABLE {name}_new RENAME TO {name}")
+    # Dropping the old table took its indexes with it
+    for index_sql in INDEXES:
+        cursor.execute(index_sql)
+
+def _step_create_schema(cursor):
+    """1: missing tables, their indexes and the default roles"""
+    for name in TABLES:
+        cursor.execute(_create_table_sql(name))
+    for index_sql in INDEXES:
+        cursor.execute(index_sql)
+    cursor.executemany(SQL_INSERT_ROLE, DEFAULT_ROLES)
+
+def _step_users_created_at_unix(cursor):
+    """2: users.created_at as unix seconds; databases from before step 1 stored timestamp text"""
+    columns = {row[1]: row[2] for row in cursor.execute("PRAGMA table_info(users)")}
+    if columns['created_at'].upper() == 'INTEGER':
+        return
+    print("👥 Converting users.created_at to unix seconds...")
+    _rebuild_table(cursor, 'users')
+
+def _step_rebuild_legacy_tables(cursor):
+    """3: tables created by older releases (rowid, non-STRICT, no CHECKs) rebuilt to TABLES"""
+    stored = dict(cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name IN (%s)"
+        % ", ".join("?" * len(TABLES)), list(TABLES)).fetchall())
+    for name, (columns, options) in TABLES.items():
+        if _table_body(stored[name]) != _table_body(f"({columns}) {options}"):
+            print(f"🔄 Rebuilding {name} to the current schema...")
+            _rebuild_table(cursor, name)
+
+# Step n upgrades a database at user_version n - 1; never reorder or edit a
+# shipped step, append a new one and bump SCHEMA_VERSION instead
+SCHEMA_STEPS = [
+    _step_create_schema,
+    _step_users_created_at_unix,
+    _step_rebuild_legacy_tables,
+]
+
 def init_db():
-    """Initialize database with tables"""
+    """Initialize the database, or upgrade it by running the schema steps it has not had yet"""
+    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_URL)
+        # Autocommit mode so the schema transaction below is exactly what we BEGIN
+        conn = sqlite3.connect(DATABASE_URL, isolation_level=None)
         cursor = conn.cursor()
         
-        # Enable foreign keys
-        cursor.execute("PRAGMA foreign_keys = ON")
+        # An already initialized database needs nothing but this one read
+        if cursor.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            print("✅ Database schema is up to date")
+            return
+        
+        # Let deletes free pages in small increments instead of a full VACUUM;
+        # a new file picks this up on its first write, an existing one needs the VACUUM below
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        
+        # WAL lets readers run alongside a writer; it persists in the file, so set it before any DDL
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA journal_size_limit = 67108864")
+        
+        # Steps rebuild tables by drop-and-rename; with foreign keys on, dropping
+        # product_category would cascade-delete every product. It cannot change
+        # inside a transaction, so it goes off here and is checked before COMMIT
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        
+        # Run all pending steps in one transaction: the version only moves if they all succeed
+        cursor.execute("BEGIN IMMEDIATE")
         
-        # Roles table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS roles (
-                role_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                role_name TEXT UNIQUE NOT NULL,
-                description TEXT
-            )
-        ''')
+        # Another worker may have upgraded it while we waited for the lock
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            cursor.execute("ROLLBACK")
+            print("✅ Database schema is up to date")
+            return
         
-        # Master table - Product Category (composite primary key)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS product_category (
-                category_id INTEGER,
-                subcategory_id INTEGER,
-                category_name TEXT UNIQUE NOT NULL,
-                description TEXT,
-                PRIMARY KEY (category_id, subcategory_id)
-            )
-        ''')
+        for step in SCHEMA_STEPS[version:]:
+            step(cursor)
         
-        # Detail table - Product (foreign key to master)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS product (
-                product_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category_id INTEGER NOT NULL,
-                subcategory_id INTEGER NOT NULL,
-                product_name TEXT UNIQUE NOT NULL,
-                price REAL NOT NULL,
-                stock_quantity INTEGER NOT NULL,
-                FOREIGN KEY (category_id, subcategory_id) 
-                REFERENCES product_category(category_id, subcategory_id)
-                ON DELETE CASCADE
-            )
-        ''')
+        violations = cursor.execute("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            raise sqlite3.IntegrityError(f"Foreign key violations after migration: {violations[:5]}")
         
-        # Updated Users table with role_id
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                hashed_password TEXT NOT NULL,
-                full_name TEXT,
-                role_id INTEGER NOT NULL DEFAULT 3, -- Default to 'user' role
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (role_id) REFERENCES roles(role_id)
-            )
-        ''')
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        cursor.execute("COMMIT")
         
-        # Insert default roles
-        cursor.execute('''
-            INSERT OR IGNORE INTO roles (role_id, role_name, description) VALUES
-            (1, 'admin', 'Full system access'),
-            (2, 'manager', 'Manage products and categories'),
-            (3, 'user', 'Read-only access')
-        ''')
+        # Databases created before auto_vacuum was set are still at NONE, where
+        # maintain_db's incremental_vacuum does nothing; one VACUUM converts them
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("🧹 Enabling incremental auto-vacuum...")
+            cursor.execute("VACUUM")
         
-        conn.commit()
-        print("✅ Database initialized successfully!")
+        # Refresh planner statistics; sqlite_stat1 also backs the health row estimates
+        cursor.execute("ANALYZE")
+        print(f"✅ Database initialized successfully! (schema {version} -> {SCHEMA_VERSION})")
         
     except Exception as e:
         print(f"❌ Database initialization error: {e}")
+        if conn is not None and conn.in_transaction:
+            cursor.execute("ROLLBACK")
         raise
     finally:
         if conn:
             conn.close()
 
+def maintain_db(pages=1000):
+    """Release up to `pages` free pages and refresh planner statistics"""
+    with get_pooled_connection() as conn:
+        # incremental_vacuum frees one page per step and execute() only steps
+        # once; executescript runs it to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)}); ANALYZE;")
+    print("✅ Database maintenance completed")
+
+# Per-connection settings: 64 MiB page cache, in-memory temp tables,
+# 1 GiB mmap window, and waiting up to 5s on a locked database
+CONNECTION_PRAGMAS = """
+    PRAGMA cache_size = -65536;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 1073741824;
+    PRAGMA busy_timeout = 5000;
+    PRAGMA foreign_keys = ON;
+"""
+
+def _database_uri(mode):
+    """file: URI for DATABASE_URL with the given SQLite open mode"""
+    return f"file:{pathname2url(DATABASE_URL)}?mode={mode}"
+
+def _configure_connection(conn, read_only=False):
+    """Apply the connection pragmas and make sure the file is in WAL mode"""
+    conn.executescript(CONNECTION_PRAGMAS)
+    if read_only:
+        return
+    # Databases copied in from elsewhere may still be in rollback-journal mode
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode != "wal":
+        journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    # NORMAL only fsyncs at checkpoints, which is crash-safe under WAL but not otherwise
+    if journal_mode == "wal":
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+def _create_pooled_connection(read_only=False):
+    """Open a connection with the pragmas applied once for its lifetime"""
+    conn = sqlite3.connect(
+        _database_uri("ro" if read_only else "rwc"),
+        uri=True,
+        check_same_thread=False,
+        cached_statements=256,
+        # No implicit deferred BEGIN; writes open their transaction via begin_write()
+        isolation_level=None
+    )
+    _configure_connection(conn, read_only)
+    return conn
+
 @contextmanager
-def get_db_connection():
-    """Database connection context manager"""
-    conn = sqlite3.connect(DATABASE_URL)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+def get_pooled_connection(read_only=False, row_factory=sqlite3.Row):
+    """Borrow a warm connection from the pool and hand it back afterwards
+    
+    Pass row_factory=None for plain tuples on bulk reads that unpack rows
+    positionally; sqlite3.Row costs an extra object per row.
+    """
+    pool = _read_pool if read_only else _pool
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _create_pooled_connection(read_only)
+    conn.row_factory = row_factory
+    broken = False
     try:
         yield conn
-    except Exception as e:
-        conn.rollback()
-        raise e
+    except sqlite3.Error:
+        # Don't hand a connection that hit a database error to the next request
+        broken = True
+        raise
     finally:
-        conn.close()
\ No newline at end of file
+        if broken:
+            conn.close()
+        else:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+@contextmanager
+def get_db_connection(row_factory=sqlite3.Row):
+    """Database connection context manager backed by the connection pool"""
+    with get_pooled_connection(row_factory=row_factory) as conn:
+        yield conn
+
+@contextmanager
+def get_db_connection_ro(row_factory=sqlite3.Row):
+    """Read-only connection from the read pool"""
+    with get_pooled_connection(read_only=True, row_factory=row_factory) as conn:
+        yield conn
+
+@contextmanager
+def use_connection(conn=None, read_only=False, row_factory=sqlite3.Row):
+    """Use the caller's connection when given, else borrow one from the pool"""
+    if conn is not None:
+        yield conn
+    else:
+        with get_pooled_connection(read_only, row_factory) as pooled:
+            yield pooled
+
+@contextmanager
+def begin_read(conn=None, row_factory=sqlite3.Row):
+    """Connection for reads; under WAL they need no BEGIN or lock"""
+    with use_connection(conn, True, row_factory) as conn:
+        yield conn
+
+@contextmanager
+def begin_write(conn=None):
+    """Write transaction that takes the write lock up front with BEGIN IMMEDIATE
+    
+    A deferred BEGIN would only ask for the lock at the first write and can
+    fail with SQLITE_BUSY there. Commits on success, rolls back on error;
+    inside a transaction the caller already opened it just joins it.
+    """
+    with use_connection(conn) as conn:
+        if conn is not None and conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            raise
+        if conn is not None and conn.in_transaction:
+            conn.commit()
+
+def db():
+    """FastAPI dependency: one pooled connection per request for the CRUD writes"""
+    with get_pooled_connection() as conn:
+        yield conn
+
+def db_ro():
+    """FastAPI dependency: one read-only pooled connection per request"""
+    with get_pooled_connection(read_only=True) as conn:
+        yield conn
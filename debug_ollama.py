@@ -1,61 +1,78 @@
 import ollama
+import functools
 import logging
+import os
+import pprint
+import sys
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# LOG_LEVEL=DEBUG also dumps the full list() response
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+TEST_MODEL = "llama3.1:latest"
 
-def debug_ollama():
+# Every record carries the probe's component and model, for structured log handlers
+logger = logging.LoggerAdapter(logging.getLogger(__name__), {"component": "ollama_debug", "model": TEST_MODEL})
+
+@functools.lru_cache(maxsize=1)
+def _get_client():
+    """Shared Ollama client so repeat probes reuse its keep-alive connection"""
+    return ollama.Client()
+
+def debug_ollama(test_generate: bool = False):
+    """Check the Ollama connection; loading a model to test generation is opt-in"""
     try:
-        client = ollama.Client()
+        client = _get_client()
         
         # Test direct list call
         logger.info("🔍 Testing Ollama client.list()...")
         models_response = client.list()
         
-        logger.info(f"📋 Response type: {type(models_response)}")
-        logger.info(f"📋 Full response: {models_response}")
-        
-        # Try different ways to access models
-        if hasattr(models_response, '__dict__'):
-            logger.info(f"📋 Response attributes: {models_response.__dict__}")
-        
-        # Check if it's a dict
+        # One type dispatch for the summary; the full dump only when debugging
         if isinstance(models_response, dict):
-            logger.info("📋 Response is a dictionary")
-            for key, value in models_response.items():
-                logger.info(f"  Key: {key}, Type: {type(value)}")
-                if key == 'models':
-                    if isinstance(value, list):
-                        logger.info(f"  Models list length: {len(value)}")
-                        for i, model in enumerate(value):
-                            logger.info(f"    Model {i}: {model}")
-                            if isinstance(model, dict):
-                                for model_key, model_value in model.items():
-                                    logger.info(f"      {model_key}: {model_value}")
-        
-        # Check if it's a list
+            models = models_response.get('models') or []
         elif isinstance(models_response, list):
-            logger.info("📋 Response is a list")
-            for i, item in enumerate(models_response):
-                logger.info(f"  Item {i}: {item}")
-                if isinstance(item, dict):
-                    for key, value in item.items():
-                        logger.info(f"    {key}: {value}")
+            models = models_response
+        else:
+            models = getattr(models_response, 'models', None) or []
+        logger.info("📋 Response type: %s, %d models", type(models_response).__name__, len(models))
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Full response:\n%s", pprint.pformat(models_response))
         
-        # Test generation with known model
-        logger.info("🧪 Testing generation with llama3.1:latest...")
+        # Check the model from its metadata; show() and ps() never load weights
+        logger.info("🧪 Checking %s...", TEST_MODEL)
         try:
-            test_response = client.generate(
-                model="llama3.1:latest",
-                prompt="Test",
-                stream=False
-            )
-            logger.info(f"✅ Generation test successful: {test_response}")
-        except Exception as e:
-            logger.error(f"❌ Generation test failed: {e}")
+            info = client.show(TEST_MODEL)
+            modelinfo = getattr(info, 'modelinfo', None) or info.get('model_info') or {}
+            logger.info("✅ Model available: %s", pprint.pformat(dict(modelinfo)))
+        except ollama.ResponseError as e:
+            logger.error("❌ Model not available: %s", e)
+        
+        # Client.ps() arrived in ollama-python 0.2.0; the pinned 0.1.7 lacks it
+        if hasattr(client, 'ps'):
+            try:
+                running = client.ps()
+                loaded = [model.get('name') or model.get('model') for model in running.get('models') or []]
+                logger.info("📦 Loaded models: %s", ", ".join(loaded) or "none")
+            except Exception as e:
+                logger.warning("⚠️ Could not list loaded models: %s", e)
+        else:
+            logger.info("📦 Loaded models: unavailable (needs ollama>=0.2.0)")
+        
+        # Deep probe: actually run the model, which loads it into memory
+        if test_generate:
+            logger.info("🧪 Testing generation with %s...", TEST_MODEL)
+            try:
+                test_response = client.generate(
+                    model=TEST_MODEL,
+                    prompt="Test",
+                    stream=False
+                )
+                logger.info("✅ Generation test successful: %s", test_response)
+            except Exception as e:
+                logger.error("❌ Generation test failed: %s", e)
             
     except Exception as e:
-        logger.error(f"💥 Debug failed: {e}")
+        logger.error("💥 Debug failed: %s", e)
 
 if __name__ == "__main__":
-    debug_ollama()
+    debug_ollama(test_generate="--generate" in sys.argv[1:])
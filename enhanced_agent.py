@@ -1,13 +1,43 @@
+import asyncio
 import logging
+import os
+import string
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 import json
-from typing import Dict, Any, List, Optional
+import threading
+from typing import AsyncIterator, Dict, Any, Iterator, List, Optional
 from enum import Enum
-from agent_tools import AICRUDTools
+from agent_tools import AICRUDTools, memoize_analytics
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import  List
 
+# pyahocorasick is optional; it matches every query keyword in one pass over the query
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# orjson is optional; it serializes the data summary several times faster than json
+try:
+    import orjson
+    _json_loads = orjson.loads
+    
+    def _summary_key(summary: Dict) -> bytes:
+        return orjson.dumps(
+            summary, default=str,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+except ImportError:
+    _json_loads = json.loads
+    
+    def _summary_key(summary: Dict) -> str:
+        return json.dumps(summary, sort_keys=True, default=str)
+
 logger = logging.getLogger(__name__)
 
 class AgentType(Enum):
@@ -18,15 +48,267 @@ class AgentType(Enum):
     RAG_AGENT = "rag"
     CRAG_AGENT = "crag"
 
+# Agent type -> label shown to the model, and its instructions; both are
+# appended after the shared business context
+AGENT_LABELS = {
+    "react": "REACT (Reasoning + Acting)",
+    "planner": "PLANNER (Strategic Planning)",
+    "supervisor": "SUPERVISOR (Multi-Agent Coordination)",
+    "rag": "RAG (Retrieval Augmented Generation)",
+    "analytics": "ANALYTICS (Data Analysis & Insights)",
+    "crag": "CRAG (Corrective RAG with Validation)",
+}
+
+AGENT_DIRECTIVES = {
+    "react": """
+Use the REACT framework.
+REASONING: analyze the situation and its root causes from the metrics above, within the user's role.
+ACTIONS: give 3-5 specific recommendations, prioritized by impact and urgency, each naming the products, categories or metrics it addresses.
+Format your response as the reasoning followed by the action steps.
+""",
+
+    "planner": """
+Create a realistic execution plan that fits current resources.
+CURRENT STATE: relevant metrics, strengths, weaknesses and constraints.
+PHASE 1 Foundation (weeks 1-2): deliverables, owners by role, success metrics.
+PHASE 2 Implementation (weeks 3-6): action steps, timeline, risk mitigation.
+PHASE 3 Optimization (weeks 7-12): monitoring and adjustments.
+""",
+
+    "supervisor": """
+Give a comprehensive cross-functional analysis.
+Connect inventory, user activity, system health and financials, and highlight the dependencies between them.
+End with an executive summary: key findings, priority recommendations with their impact, and an implementation roadmap.
+""",
+
+    "rag": """
+Retrieve and present the business data relevant to the query.
+Use tables or lists, highlight key findings and comparisons, explain what the numbers mean for the business, and note any gaps in the data.
+""",
+
+    "analytics": """
+Give data-driven analytical insights.
+Compute percentages, ratios and trends, compare categories, and flag outliers.
+Turn the patterns into metric-based recommendations and KPIs to monitor, with their expected impact.
+""",
+
+    "crag": """
+Use self-corrective analysis.
+Give an initial assessment, then check it against the other data sources for inconsistencies and data-quality issues.
+Correct it, state your confidence in each finding, and list the final validated recommendations and the data still needed.
+"""
+}
+
+def _product_columns(products: List[Dict]):
+    """Price and stock columns as arrays, one pass over the product dicts"""
+    # A missing price becomes NaN so the price statistics can skip it
+    prices = np.array([p.get('price') for p in products], dtype=np.float64)
+    # float64 stocks let the value dot product run in BLAS without an upcast copy
+    stocks = np.array([p.get('stock_quantity') or 0 for p in products], dtype=np.float64)
+    return prices, stocks
+
+def _inventory_value(prices, stocks) -> float:
+    """Sum of price * stock as one dot product; missing prices count as zero"""
+    value = prices @ stocks
+    if np.isnan(value):
+        # Only when some price is missing; redo it skipping those rows
+        value = np.nansum(prices * stocks)
+    return float(value)
+
+# Business data key -> tool that collects it. The tools are independent reads
+# that each borrow their own read connection, so they run side by side
+BUSINESS_DATA_TOOLS = {
+    'system_health': AICRUDTools.get_system_health,
+    'user_analytics': AICRUDTools.analyze_user_behavior,
+    'sales_trends': AICRUDTools.get_sales_trends,
+    'category_insights': AICRUDTools.get_category_insights,
+    'products': lambda: AICRUDTools.search_products(""),
+    'low_stock': AICRUDTools.get_low_stock_products,
+}
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=len(BUSINESS_DATA_TOOLS), thread_name_prefix="agent-tools")
+TOOL_TIMEOUT = 10
+
+# Agent type -> smaller quantized model for agents that mostly restate the data
+# in the prompt; used only when it is installed, otherwise the main model answers
+AGENT_MODELS = {
+    "rag": os.getenv("AIBI_RAG_MODEL", "llama3.2:1b"),
+    "analytics": os.getenv("AIBI_ANALYTICS_MODEL", "llama3.1:8b-instruct-q4_K_M"),
+}
+
+# Rows of each data list quoted in the prompt's additional context
+PROMPT_SAMPLE_SIZE = 3
+
+# Query context flag -> keywords that set it
+QUERY_CONTEXT_KEYWORDS = {
+    'is_financial': frozenset({'financial', 'revenue', 'cost', 'profit', 'money', 'price', 'budget'}),
+    'is_inventory': frozenset({'inventory', 'stock', 'product', 'item', 'quantity'}),
+    'is_user_related': frozenset({'user', 'team', 'employee', 'staff', 'role', 'performance'}),
+    'is_system_related': frozenset({'system', 'health', 'performance', 'database', 'technical'}),
+    'is_strategic': frozenset({'strategy', 'plan', 'roadmap', 'future', 'growth'}),
+    'is_analytical': frozenset({'analyze', 'analysis', 'trend', 'pattern', 'insight'}),
+}
+
+# Query context flag -> the word naming it on the prompt's QUERY FOCUS line;
+# only set flags are listed, instead of the whole dict of booleans
+QUERY_FOCUS_LABELS = {
+    'is_financial': 'financial',
+    'is_inventory': 'inventory',
+    'is_user_related': 'users',
+    'is_system_related': 'system',
+    'is_strategic': 'strategy',
+    'is_analytical': 'analysis',
+}
+
+# Agent type -> keywords that route a query to it, in priority order
+AGENT_ROUTING_KEYWORDS = {
+    "planner": frozenset({'plan', 'strategy', 'roadmap', 'timeline', 'schedule', 'develop'}),
+    "analytics": frozenset({'analyze', 'analysis', 'trend', 'pattern', 'insight', 'metric', 'statistic'}),
+    "rag": frozenset({'show', 'list', 'get', 'find', 'retrieve', 'display', 'what'}),
+    "supervisor": frozenset({'comprehensive', 'complete', 'overview', 'assessment', 'report', 'review'}),
+    "react": frozenset({'why', 'how', 'solve', 'fix', 'improve', 'problem', 'issue', 'trouble'}),
+    "crag": frozenset({'validate', 'verify', 'check', 'review', 'assess', 'correct'}),
+}
+
+_PUNCTUATION_TO_SPACE = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+class KeywordMatcher:
+    """Finds which keyword groups occur as substrings of a text"""
+    
+    def __init__(self, groups: Dict[str, frozenset]):
+        self.groups = groups
+        self.automaton = None
+        
+        if ahocorasick is not None:
+            # One automaton over all keywords, each mapped to every group that lists it
+            keyword_groups = {}
+            for group, keywords in groups.items():
+                for keyword in keywords:
+                    keyword_groups.setdefault(keyword, set()).add(group)
+            self.automaton = ahocorasick.Automaton()
+            for keyword, matched in keyword_groups.items():
+                self.automaton.add_word(keyword, frozenset(matched))
+            self.automaton.make_automaton()
+    
+    def match(self, text: str) -> set:
+        """Names of the groups with at least one keyword in text"""
+        if self.automaton is None:
+            # Split once; a keyword that is a whole word of the text is a set
+            # lookup, and only groups without one fall back to substring scans
+            words = set(text.translate(_PUNCTUATION_TO_SPACE).split())
+            return {
+                group for group, keywords in self.groups.items()
+                if not keywords.isdisjoint(words) or any(k in text for k in keywords)
+            }
+        
+        hits = set()
+        for _, matched in self.automaton.iter(text):
+            hits |= matched
+        return hits
+
+_CONTEXT_MATCHER = KeywordMatcher(QUERY_CONTEXT_KEYWORDS)
+_ROUTING_MATCHER = KeywordMatcher(AGENT_ROUTING_KEYWORDS)
+
+# Blocks of the business-data preamble shared by every agent prompt, filled by build_base_context
+CONTEXT_STATE_TEMPLATE = """
+REAL BUSINESS DATA CONTEXT:
+
+CURRENT BUSINESS STATE:
+- System Status: {system_status} (Score: {health_score})
+- Total Products: {total_products} across {total_categories} categories
+- Active Users: {active_users} out of {total_users} total users
+- Inventory Value: ${total_inventory_value:.2f}
+- Low Stock Alerts: {low_stock_alerts} items need attention
+"""
+
+CONTEXT_INVENTORY_TEMPLATE = """
+INVENTORY DETAILS:
+- Average Price: ${avg_product_price:.2f}
+- Total Stock Quantity: {total_stock_quantity}
+- Critical Low Stock: {low_stock_count} products
+- Low Stock Value: ${low_stock_value:.2f}
+"""
+
+CONTEXT_USERS_TEMPLATE = """
+USER DISTRIBUTION:
+- Role Breakdown: {role_counts}
+"""
+
+CONTEXT_EXTRA_TEMPLATE = """
+ADDITIONAL CONTEXT:
+{data_context}
+
+QUERY FOCUS: {query_focus}
+Support every finding with the actual numbers above.
+"""
+
+_SUMMARY_DEFAULTS = {
+    'system_status': 'Unknown',
+    'health_score': 'N/A',
+    'total_products': 0,
+    'total_categories': 0,
+    'active_users': 0,
+    'total_users': 0,
+    'total_inventory_value': 0,
+    'low_stock_alerts': 0,
+    'avg_product_price': 0,
+    'total_stock_quantity': 0,
+    'low_stock_count': 0,
+    'low_stock_value': 0,
+    'role_counts': {},
+}
+
+def _select_context_blocks(active_flags: tuple) -> List[str]:
+    """Context blocks relevant to the query; a query with no data focus gets them all"""
+    inventory = 'is_inventory' in active_flags or 'is_financial' in active_flags
+    users = 'is_user_related' in active_flags
+    focused = inventory or users
+    
+    blocks = [CONTEXT_STATE_TEMPLATE]
+    if inventory or not focused:
+        blocks.append(CONTEXT_INVENTORY_TEMPLATE)
+    if users or not focused:
+        blocks.append(CONTEXT_USERS_TEMPLATE)
+    blocks.append(CONTEXT_EXTRA_TEMPLATE)
+    return blocks
+
+@lru_cache(maxsize=256)
+def _render_base_context(summary_json, data_context: str, active_flags: tuple) -> str:
+    """Fill the context blocks; every agent prompt over one data snapshot shares the render"""
+    query_focus = ", ".join(QUERY_FOCUS_LABELS.get(flag, flag) for flag in active_flags)
+    return "".join(_select_context_blocks(active_flags)).format_map({
+        **_SUMMARY_DEFAULTS,
+        **_json_loads(summary_json),
+        'data_context': data_context,
+        'query_focus': query_focus or 'general',
+    })
+
+# Everything after the query lines of a single-agent prompt, built once per agent type
+AGENT_PROMPT_BLOCKS = {
+    agent_type: f"AGENT TYPE: {AGENT_LABELS[agent_type]}\n{directive}"
+    for agent_type, directive in AGENT_DIRECTIVES.items()
+}
+
+@lru_cache(maxsize=64)
+def _agent_prompt_tail(agent_type: str, user_role: str) -> str:
+    """Role line plus agent block; there are only a few roles, so each pair is built once"""
+    return f"\nUSER ROLE: {user_role}\n{AGENT_PROMPT_BLOCKS[agent_type]}"
+
 class EnhancedAIAgent:
     def __init__(self, model: str = "llama3.1:latest"):
         self.model = model
         self.available = False
         self.client = None
+        self.aclient = None
+        self.installed_models = set()
+        # Generations in flight, keyed by (model, prompt); see safe_generate
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
         
         try:
             import ollama
             self.client = ollama.Client()
+            # The async client streams replies without blocking the event loop
+            self.aclient = ollama.AsyncClient()
             self.available = self.test_connection()
             logger.info(f"✅ Enhanced AI Agent initialized: {self.available}")
         except Exception as e:
@@ -58,32 +340,76 @@ class EnhancedAIAgent:
                 elif isinstance(model, dict):
                     available_models.append(model.get('model') or model.get('name', 'unknown'))
             
+            self.installed_models = set(available_models)
+            
             # Use first available model
             if available_models:
                 self.model = available_models[0]
                 logger.info(f"✅ Enhanced Agent using model: {self.model}")
-                
-                # Test generation
-                response = self.client.generate(
-                    model=self.model,
-                    prompt="Test connection",
-                    stream=False
-                )
-                return bool(response and 'response' in response)
+                # A listed model is enough here; the generation test runs in warmup()
+                return True
             return False
             
         except Exception as e:
             logger.error(f"❌ Enhanced Agent connection test failed: {e}")
             return False
 
-    def safe_generate(self, prompt: str) -> str:
-        """Safe LLM generation"""
+    def warmup(self) -> bool:
+        """Test generation once, which also loads the model before the first real query"""
         if not self.available or not self.client:
-            return "AI service is currently unavailable."
+            return False
         
         try:
             response = self.client.generate(
                 model=self.model,
+                prompt="Test connection",
+                stream=False
+            )
+            self.available = bool(response and 'response' in response)
+        except Exception as e:
+            logger.error(f"❌ Enhanced Agent warmup failed: {e}")
+            self.available = False
+        
+        logger.info(f"🔥 Enhanced Agent warmup completed: {self.available}")
+        return self.available
+
+    def model_for(self, agent_type: str) -> str:
+        """Model that answers for agent_type"""
+        model = AGENT_MODELS.get(agent_type)
+        return model if model in self.installed_models else self.model
+
+    def safe_generate(self, prompt: str, model: str = None) -> str:
+        """Safe LLM generation
+
+        Concurrent calls with the same model and prompt share one generation:
+        the first caller runs it and the others wait on its future.
+        """
+        model = model or self.model
+        key = (model, prompt)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        
+        if owner:
+            try:
+                future.set_result(self._generate(prompt, model))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._inflight_lock:
+                    del self._inflight[key]
+        return future.result()
+
+    def _generate(self, prompt: str, model: str) -> str:
+        """One generate call on the sync client"""
+        if not self.available or not self.client:
+            return "AI service is currently unavailable."
+        
+        try:
+            response = self.client.generate(
+                model=model or self.model,
                 prompt=prompt,
                 stream=False,
                 options={'timeout': 300000}
@@ -93,6 +419,43 @@ class EnhancedAIAgent:
             logger.error(f"❌ Generation error: {e}")
             return f"Error generating response: {str(e)}"
 
+    def safe_generate_iter(self, prompt: str, model: str = None) -> Iterator[str]:
+        """Safe LLM generation that yields the response as the model produces it"""
+        if not self.available or not self.client:
+            yield "AI service is currently unavailable."
+            return
+        
+        try:
+            for chunk in self.client.generate(
+                model=model or self.model,
+                prompt=prompt,
+                stream=True,
+                options={'timeout': 300000}
+            ):
+                yield chunk.get('response', '')
+        except Exception as e:
+            logger.error(f"❌ Generation error: {e}")
+            yield f"Error generating response: {str(e)}"
+
+    async def safe_generate_stream(self, prompt: str, model: str = None) -> AsyncIterator[str]:
+        """Safe LLM generation that yields the response as the model produces it"""
+        if not self.available or not self.aclient:
+            yield "AI service is currently unavailable."
+            return
+        
+        try:
+            stream = await self.aclient.generate(
+                model=model or self.model,
+                prompt=prompt,
+                stream=True,
+                options={'timeout': 300000}
+            )
+            async for chunk in stream:
+                yield chunk.get('response', '')
+        except Exception as e:
+            logger.error(f"❌ Generation error: {e}")
+            yield f"Error generating response: {str(e)}"
+
     def supervisor_agent(self, query: str, user_role: str, conversation_history: List = None) -> Dict:
         """Orchestrates agent team based on query complexity with REAL data"""
         try:
@@ -102,28 +465,87 @@ class EnhancedAIAgent:
             # Analyze query to determine which agent to use
             agent_type = self.analyze_query_type(query)
             
-            # Generate response using REAL data
-            prompt = self.create_data_rich_prompt(query, user_role, agent_type, real_data)
-            response = self.safe_generate(prompt)
-            
+            # Hand the data we already have to the chosen agent so it doesn't collect it again
+            result = self._dispatch(agent_type, query, user_role, real_data)
+            result["reasoning"] = f"Used {agent_type} approach with comprehensive business data"
+            return result
+        except Exception as e:
+            logger.error(f"❌ Supervisor agent error: {e}")
             return {
-                "response": response,
-                "type": agent_type,
-                "data": real_data,
-                "reasoning": f"Used {agent_type} approach with comprehensive business data",
-                "needs_human_review": False
+                "response": f"Error processing request: {str(e)}",
+                "type": "error",
+                "data": {},
+                "reasoning": f"Error: {str(e)}",
+                "needs_human_review": True
             }
+
+    def supervisor_agent_streaming(self, query: str, user_role: str, conversation_history: List = None) -> Dict:
+        """supervisor_agent with the response as a token iterator under "stream"
+        
+        The data and agent choice are ready on return; the model's tokens
+        arrive as the caller consumes the stream.
+        """
+        try:
+            real_data = self.get_comprehensive_business_data(query)
+            agent_type = self.analyze_query_type(query)
+            prompt = self.create_data_rich_prompt(query, user_role, agent_type, real_data)
         except Exception as e:
             logger.error(f"❌ Supervisor agent error: {e}")
             return {
-                "response": f"Error processing request: {str(e)}",
+                "stream": iter([f"Error processing request: {str(e)}"]),
                 "type": "error",
                 "data": {},
                 "reasoning": f"Error: {str(e)}",
                 "needs_human_review": True
             }
+        
+        return {
+            "stream": self.safe_generate_iter(prompt, self.model_for(agent_type)),
+            "type": agent_type,
+            "data": real_data,
+            "reasoning": f"Used {agent_type} approach with comprehensive business data",
+            "needs_human_review": False
+        }
+
+    async def supervisor_agent_stream(self, query: str, user_role: str) -> AsyncIterator[str]:
+        """supervisor_agent, streaming the chosen agent's response token by token"""
+        try:
+            real_data = await asyncio.to_thread(self.get_comprehensive_business_data, query)
+            agent_type = self.analyze_query_type(query)
+            prompt = self.create_data_rich_prompt(query, user_role, agent_type, real_data)
+        except Exception as e:
+            logger.error(f"❌ Supervisor agent error: {e}")
+            yield f"Error processing request: {str(e)}"
+            return
+        
+        async for token in self.safe_generate_stream(prompt, self.model_for(agent_type)):
+            yield token
+
+    def _dispatch(self, agent_type: str, query: str, user_role: str, data: Dict) -> Dict:
+        """Answer with the given agent over data the caller already collected"""
+        specialist = self._specialists.get(agent_type)
+        if specialist is not None:
+            return specialist(self, query, user_role, data=data)
+        
+        # The supervisor answers itself
+        prompt = self.create_data_rich_prompt(query, user_role, agent_type, data)
+        return {
+            "response": self.safe_generate(prompt),
+            "type": agent_type,
+            "data": data,
+            "reasoning": f"Used {agent_type} approach with comprehensive business data",
+            "needs_human_review": False
+        }
 
     def get_comprehensive_business_data(self, query: str) -> Dict[str, Any]:
+        """Get comprehensive business data, shared read-only by queries with the same context"""
+        # The data depends on the query only through its context flags, so
+        # follow-up questions reuse it until it expires or the data changes
+        query_context = self.analyze_query_context(query.lower())
+        key = "business_data:" + json.dumps(query_context, sort_keys=True)
+        return memoize_analytics(key, lambda: self._collect_business_data(query))
+
+    def _collect_business_data(self, query: str) -> Dict[str, Any]:
         """Get comprehensive real business data based on query context"""
         data = {}
         query_lower = query.lower()
@@ -131,28 +553,21 @@ class EnhancedAIAgent:
         try:
             logger.info("🔄 Collecting comprehensive business data...")
             
-            # ALWAYS get system health and user analytics for context
-            data['system_health'] = AICRUDTools.get_system_health()
-            data['user_analytics'] = AICRUDTools.analyze_user_behavior()
-            data['sales_trends'] = AICRUDTools.get_sales_trends()
-            data['category_insights'] = AICRUDTools.get_category_insights()
-            
-            # Product and inventory data - always include for business context
-            data['products'] = AICRUDTools.search_products("")
-            data['low_stock'] = AICRUDTools.get_low_stock_products()
-            
-            # Enhanced data based on query focus
-            if any(term in query_lower for term in ['product', 'inventory', 'stock', 'item']):
-                # Already included above
-                pass
-            
-            if any(term in query_lower for term in ['user', 'team', 'employee', 'staff', 'performance', 'role']):
-                # user_analytics already included above
-                pass
-                
-            if any(term in query_lower for term in ['category', 'classification', 'group']):
-                # category_insights already included above
-                pass
+            # ALWAYS get every tool's data for context; the queries overlap on the tool pool
+            futures = {name: _TOOL_EXECUTOR.submit(tool) for name, tool in BUSINESS_DATA_TOOLS.items()}
+            errors = []
+            for name, future in futures.items():
+                try:
+                    data[name] = future.result(timeout=TOOL_TIMEOUT)
+                except Exception as e:
+                    # One slow or failing tool leaves the others' data usable
+                    reason = str(e) or type(e).__name__
+                    logger.error(f"❌ Collecting {name} failed: {reason}")
+                    errors.append(f"{name}: {reason}")
+                    data[name] = [] if name in ('products', 'low_stock') else {'error': reason}
+            if errors:
+                # Also keeps this incomplete snapshot out of the analytics cache
+                data['error'] = "; ".join(errors)
             
             # Add data summaries for easier processing
             data['summary'] = self.create_data_summary(data)
@@ -201,21 +616,20 @@ class EnhancedAIAgent:
                 products = data['products']
                 summary['total_products_count'] = len(products)
                 
-                # Calculate price statistics
-                prices = [float(p.get('price', 0)) for p in products if p.get('price') is not None]
-                if prices:
-                    summary['avg_product_price'] = sum(prices) / len(prices)
-                    summary['max_product_price'] = max(prices)
-                    summary['min_product_price'] = min(prices)
+                # Vectorized statistics; cast back to Python numbers for the JSON encoders
+                prices, stocks = _product_columns(products)
+                priced = prices[~np.isnan(prices)]
+                if priced.size:
+                    summary['avg_product_price'] = float(priced.mean())
+                    summary['max_product_price'] = float(priced.max())
+                    summary['min_product_price'] = float(priced.min())
                 
                 # Calculate stock statistics
-                stock_levels = [p.get('stock_quantity', 0) for p in products]
-                summary['total_stock_quantity'] = sum(stock_levels)
-                summary['avg_stock_level'] = sum(stock_levels) / len(stock_levels) if stock_levels else 0
+                summary['total_stock_quantity'] = int(stocks.sum())
+                summary['avg_stock_level'] = float(stocks.mean())
                 
                 # Calculate inventory value
-                total_value = sum([float(p.get('price', 0)) * p.get('stock_quantity', 0) for p in products])
-                summary['total_inventory_value'] = total_value
+                summary['total_inventory_value'] = _inventory_value(prices, stocks)
 
             # Low stock summary
             if 'low_stock' in data and data['low_stock']:
@@ -225,8 +639,8 @@ class EnhancedAIAgent:
                 summary['critical_products'] = low_stock_products
                 
                 # Low stock value
-                low_stock_value = sum([float(p.get('price', 0)) * p.get('stock_quantity', 0) for p in low_stock])
-                summary['low_stock_value'] = low_stock_value
+                prices, stocks = _product_columns(low_stock)
+                summary['low_stock_value'] = _inventory_value(prices, stocks)
 
             # Sales trends summary
             if 'sales_trends' in data and data['sales_trends']:
@@ -256,274 +670,35 @@ class EnhancedAIAgent:
 
     def analyze_query_context(self, query_lower: str) -> Dict[str, Any]:
         """Analyze query context for better data targeting"""
-        context = {
-            'is_financial': any(term in query_lower for term in ['financial', 'revenue', 'cost', 'profit', 'money', 'price', 'budget']),
-            'is_inventory': any(term in query_lower for term in ['inventory', 'stock', 'product', 'item', 'quantity']),
-            'is_user_related': any(term in query_lower for term in ['user', 'team', 'employee', 'staff', 'role', 'performance']),
-            'is_system_related': any(term in query_lower for term in ['system', 'health', 'performance', 'database', 'technical']),
-            'is_strategic': any(term in query_lower for term in ['strategy', 'plan', 'roadmap', 'future', 'growth']),
-            'is_analytical': any(term in query_lower for term in ['analyze', 'analysis', 'trend', 'pattern', 'insight']),
-        }
-        return context
+        hits = _CONTEXT_MATCHER.match(query_lower)
+        return {flag: flag in hits for flag in QUERY_CONTEXT_KEYWORDS}
 
     def analyze_query_type(self, query: str) -> str:
         """Analyze query to determine appropriate agent type"""
-        query_lower = query.lower()
-        
-        # Planning queries
-        if any(word in query_lower for word in ['plan', 'strategy', 'roadmap', 'timeline', 'schedule', 'develop']):
-            return "planner"
-        
-        # Analytical queries
-        elif any(word in query_lower for word in ['analyze', 'analysis', 'trend', 'pattern', 'insight', 'metric', 'statistic']):
-            return "analytics"
-        
-        # Data retrieval queries
-        elif any(word in query_lower for word in ['show', 'list', 'get', 'find', 'retrieve', 'display', 'what']):
-            return "rag"
-        
-        # Complex multi-faceted queries
-        elif any(word in query_lower for word in ['comprehensive', 'complete', 'overview', 'assessment', 'report', 'review']):
-            return "supervisor"
+        hits = _ROUTING_MATCHER.match(query.lower())
         
-        # Problem-solving queries
-        elif any(word in query_lower for word in ['why', 'how', 'solve', 'fix', 'improve', 'problem', 'issue', 'trouble']):
-            return "react"
-        
-        # Validation queries
-        elif any(word in query_lower for word in ['validate', 'verify', 'check', 'review', 'assess', 'correct', 'validate']):
-            return "crag"
-        
-        # Default to supervisor for complex queries
-        else:
-            return "supervisor"
+        # The first matching agent in priority order wins; default to supervisor for complex queries
+        for agent_type in AGENT_ROUTING_KEYWORDS:
+            if agent_type in hits:
+                return agent_type
+        return "supervisor"
 
-    def create_data_rich_prompt(self, query: str, user_role: str, agent_type: str, real_data: Dict) -> str:
-        """Create enhanced prompt with REAL business data"""
-        
-        data_summary = real_data.get('summary', {})
+    def build_base_context(self, real_data: Dict) -> str:
+        """Shared business-data preamble for every agent prompt"""
         query_context = real_data.get('query_context', {})
-        data_context = self.format_data_for_prompt(real_data)
-        
-        base_context = f"""
-        REAL BUSINESS DATA CONTEXT:
-
-        CURRENT BUSINESS STATE:
-        - System Status: {data_summary.get('system_status', 'Unknown')} (Score: {data_summary.get('health_score', 'N/A')})
-        - Total Products: {data_summary.get('total_products', 0)} across {data_summary.get('total_categories', 0)} categories
-        - Active Users: {data_summary.get('active_users', 0)} out of {data_summary.get('total_users', 0)} total users
-        - Inventory Value: ${data_summary.get('total_inventory_value', 0):.2f}
-        - Low Stock Alerts: {data_summary.get('low_stock_alerts', 0)} items need attention
-
-        INVENTORY DETAILS:
-        - Products in System: {data_summary.get('total_products_count', 0)}
-        - Average Price: ${data_summary.get('avg_product_price', 0):.2f}
-        - Total Stock Quantity: {data_summary.get('total_stock_quantity', 0)}
-        - Critical Low Stock: {data_summary.get('low_stock_count', 0)} products
-        - Low Stock Value: ${data_summary.get('low_stock_value', 0):.2f}
-
-        USER DISTRIBUTION:
-        - Role Breakdown: {data_summary.get('role_counts', {})}
-        - Active vs Total: {data_summary.get('active_users', 0)}/{data_summary.get('total_users', 0)}
+        # Keyed on the content itself, so a changed snapshot can never hit a stale render
+        summary_json = _summary_key(real_data.get('summary', {}))
+        active_flags = tuple(flag for flag, on in query_context.items() if on)
+        return _render_base_context(summary_json, self.format_data_for_prompt(real_data), active_flags)
 
-        ADDITIONAL CONTEXT:
-        {data_context}
-
-        QUERY CONTEXT: {query_context}
-        """
+    def create_data_rich_prompt(self, query: str, user_role: str, agent_type: str, real_data: Dict) -> str:
+        """Create enhanced prompt with REAL business data"""
+        base_context = self.build_base_context(real_data)
         
-        agent_specific_prompts = {
-            "react": f"""
-            {base_context}
-            
-            USER QUERY: {query}
-            USER ROLE: {user_role}
-            AGENT TYPE: REACT (Reasoning + Acting)
-            
-            Use REACT framework with ACTUAL DATA:
-            
-            REASONING PHASE:
-            1. Analyze the current business situation using the real data above
-            2. Identify root causes based on specific metrics and patterns
-            3. Consider the user's role and permissions in your analysis
-            4. Use actual numbers from the business data to support your reasoning
-            
-            ACTION PHASE:
-            1. Provide 3-5 specific, actionable recommendations
-            2. Base each action on the actual business metrics
-            3. Consider implementation feasibility given current resources
-            4. Prioritize actions by impact and urgency
-            5. Reference specific products, categories, or metrics where relevant
-            
-            Format your response with clear reasoning followed by actionable steps.
-            Use actual numbers from the data to make your recommendations credible.
-            """,
-            
-            "planner": f"""
-            {base_context}
-            
-            USER QUERY: {query}
-            USER ROLE: {user_role}
-            AGENT TYPE: PLANNER (Strategic Planning)
-            
-            Create REALISTIC EXECUTION PLAN using actual business context:
-            
-            CURRENT STATE ASSESSMENT:
-            - Summarize key metrics relevant to the planning objective
-            - Identify strengths and weaknesses from the data
-            - Consider resource constraints (users, products, system capacity)
-            
-            PLANNING FRAMEWORK:
-            PHASE 1: Foundation (Weeks 1-2)
-            - Specific deliverables based on current capabilities
-            - Resource allocation using actual user roles
-            - Success metrics tied to existing business metrics
-            
-            PHASE 2: Implementation (Weeks 3-6)  
-            - Action steps with clear ownership
-            - Timeline based on current workload
-            - Risk mitigation using system health data
-            
-            PHASE 3: Optimization (Weeks 7-12)
-            - Performance monitoring using existing metrics
-            - Adjustment strategies
-            - Long-term sustainability planning
-            
-            Ensure the plan is actionable with current resources and data.
-            Reference specific numbers from the business context.
-            """,
-            
-            "supervisor": f"""
-            {base_context}
-            
-            USER QUERY: {query}
-            USER ROLE: {user_role}
-            AGENT TYPE: SUPERVISOR (Multi-Agent Coordination)
-            
-            Provide COMPREHENSIVE BUSINESS ANALYSIS by coordinating multiple perspectives:
-            
-            CROSS-FUNCTIONAL ANALYSIS:
-            - Connect inventory data with user activity patterns
-            - Relate system health to business performance
-            - Analyze financial implications of operational metrics
-            - Consider strategic impact of tactical findings
-            
-            INTEGRATED INSIGHTS:
-            - Identify patterns across different data sources
-            - Highlight dependencies between business functions
-            - Provide holistic recommendations that consider multiple aspects
-            - Balance short-term actions with long-term strategy
-            
-            EXECUTIVE SUMMARY:
-            - Key findings from the comprehensive analysis
-            - Priority recommendations across business functions
-            - Impact assessment based on actual metrics
-            - Implementation roadmap considering all constraints
-            
-            Create a unified view that connects different business aspects.
-            Use actual numbers to support cross-functional insights.
-            """,
-            
-            "rag": f"""
-            {base_context}
-            
-            USER QUERY: {query}
-            USER ROLE: {user_role}
-            AGENT TYPE: RAG (Retrieval Augmented Generation)
-            
-            RETRIEVE AND PRESENT SPECIFIC BUSINESS DATA:
-            
-            DATA RETRIEVAL:
-            - Extract the most relevant information from the business data
-            - Focus on accuracy and completeness
-            - Present data in a clear, organized manner
-            - Include context for understanding the numbers
-            
-            INFORMATION PRESENTATION:
-            - Use tables or lists for multiple data points
-            - Highlight key findings and patterns
-            - Provide comparisons where relevant
-            - Include summary statistics
-            
-            CONTEXTUAL INSIGHTS:
-            - Explain what the data means for the business
-            - Connect data points to business objectives
-            - Suggest follow-up questions or analyses
-            - Note any data limitations or gaps
-            
-            Focus on factual accuracy and clear presentation of business information.
-            """,
-            
-            "analytics": f"""
-            {base_context}
-            
-            USER QUERY: {query}
-            USER ROLE: {user_role}
-            AGENT TYPE: ANALYTICS (Data Analysis & Insights)
-            
-            Provide DATA-DRIVEN ANALYTICAL INSIGHTS:
-            
-            QUANTITATIVE ANALYSIS:
-            - Calculate percentages, ratios, and trends from the data
-            - Identify statistical patterns and correlations
-            - Perform comparative analysis across categories or time periods
-            - Use mathematical models where appropriate
-            
-            TREND IDENTIFICATION:
-            - Spot emerging patterns in the business data
-            - Identify seasonal or cyclical variations
-            - Highlight performance outliers
-            - Project future trends based on historical data
-            
-            ACTIONABLE INSIGHTS:
-            - Translate data patterns into business intelligence
-            - Provide metrics-based recommendations
-            - Suggest KPIs for ongoing monitoring
-            - Calculate potential impact of changes
-            
-            Use rigorous analytical approach with actual numbers.
-            Provide both the analysis and the business implications.
-            """,
-            
-            "crag": f"""
-            {base_context}
-            
-            USER QUERY: {query}
-            USER ROLE: {user_role}
-            AGENT TYPE: CRAG (Corrective RAG with Validation)
-            
-            Use SELF-REFLECTIVE ANALYSIS with data validation:
-            
-            INITIAL ASSESSMENT:
-            - Provide initial analysis based on available data
-            - Identify key findings and recommendations
-            - Note any assumptions made during analysis
-            
-            DATA VALIDATION:
-            - Cross-reference findings with multiple data sources
-            - Check for consistency across different metrics
-            - Identify potential data quality issues
-            - Validate assumptions against actual business context
-            
-            CORRECTIVE ANALYSIS:
-            - Refine recommendations based on validation
-            - Correct any inaccurate assumptions
-            - Provide confidence levels for different findings
-            - Suggest additional data needed for higher confidence
-            
-            IMPROVED RECOMMENDATIONS:
-            - Final validated recommendations
-            - Implementation considerations
-            - Monitoring suggestions for ongoing validation
-            - Risk assessment based on data quality
-            
-            Show your validation process and how it improved the analysis.
-            Be transparent about data limitations and confidence levels.
-            """
-        }
+        if agent_type not in AGENT_DIRECTIVES:
+            return base_context + f"\n\nQUERY: {query}\nUSER ROLE: {user_role}\n\nProvide a comprehensive response using the business data above."
         
-        return agent_specific_prompts.get(agent_type, 
-            base_context + f"\n\nQUERY: {query}\nUSER ROLE: {user_role}\n\nProvide a comprehensive response using the business data above.")
+        return "".join([base_context, "\nUSER QUERY: ", query, _agent_prompt_tail(agent_type, user_role)])
 
     def format_data_for_prompt(self, data: Dict) -> str:
         """Format data for inclusion in prompts"""
@@ -531,26 +706,25 @@ class EnhancedAIAgent:
         
         try:
             # Format products data
-            if 'products' in data and data['products']:
-                sample_products = data['products'][:3]
-                product_info = []
-                for product in sample_products:
-                    name = product.get('product_name', 'Unknown')[:20]
-                    stock = product.get('stock_quantity', 0)
-                    price = product.get('price', 0)
-                    product_info.append(f"{name} (Stock: {stock}, Price: ${price})")
-                formatted.append(f"Sample Products: {', '.join(product_info)}")
-            
-            # Format low stock data
-            if 'low_stock' in data and data['low_stock']:
-                low_stock_names = [p.get('product_name', 'Unknown')[:15] for p in data['low_stock'][:3]]
-                formatted.append(f"Critical Low Stock: {', '.join(low_stock_names)}")
+            products = data.get('products')
+            if products:
+                formatted.append("Sample Products: " + ", ".join(
+                    f"{p.get('product_name', 'Unknown')[:20]} (Stock: {p.get('stock_quantity', 0)}, Price: ${p.get('price', 0)})"
+                    for p in islice(products, PROMPT_SAMPLE_SIZE)
+                ))
+            
+            # Format low stock data; the list is already sorted by stock, lowest first
+            low_stock = data.get('low_stock')
+            if low_stock:
+                formatted.append("Critical Low Stock: " + ", ".join(
+                    p.get('product_name', 'Unknown')[:15] for p in islice(low_stock, PROMPT_SAMPLE_SIZE)
+                ))
             
             # Format user distribution
             if 'user_analytics' in data:
                 user_data = data['user_analytics'].get('user_analytics', {})
                 role_dist = user_data.get('role_distribution', [])
-                roles = [f"{r.get('role_name', 'Unknown')}: {r.get('user_count', 0)}" for r in role_dist[:3]]
+                roles = [f"{r.get('role_name', 'Unknown')}: {r.get('user_count', 0)}" for r in role_dist[:PROMPT_SAMPLE_SIZE]]
                 if roles:
                     formatted.append(f"User Roles: {', '.join(roles)}")
             
@@ -558,7 +732,7 @@ class EnhancedAIAgent:
             if 'category_insights' in data:
                 cats = data['category_insights'].get('category_insights', [])
                 if cats:
-                    cat_names = [c.get('category_name', 'Unknown')[:15] for c in cats[:3]]
+                    cat_names = [c.get('category_name', 'Unknown')[:15] for c in cats[:PROMPT_SAMPLE_SIZE]]
                     formatted.append(f"Top Categories: {', '.join(cat_names)}")
             
             # Format sales trends
@@ -579,7 +753,7 @@ class EnhancedAIAgent:
             data = self.get_comprehensive_business_data(query)
         
         prompt = self.create_data_rich_prompt(query, user_role, "react", data)
-        response = self.safe_generate(prompt)
+        response = self.safe_generate(prompt, self.model_for("react"))
         
         return {
             "response": response,
@@ -595,7 +769,7 @@ class EnhancedAIAgent:
             data = self.get_comprehensive_business_data(query)
         
         prompt = self.create_data_rich_prompt(query, user_role, "planner", data)
-        response = self.safe_generate(prompt)
+        response = self.safe_generate(prompt, self.model_for("planner"))
         
         return {
             "response": response,
@@ -611,7 +785,7 @@ class EnhancedAIAgent:
             data = self.get_comprehensive_business_data(query)
         
         prompt = self.create_data_rich_prompt(query, user_role, "analytics", data)
-        response = self.safe_generate(prompt)
+        response = self.safe_generate(prompt, self.model_for("analytics"))
         
         return {
             "response": response,
@@ -627,7 +801,7 @@ class EnhancedAIAgent:
             data = self.get_comprehensive_business_data(query)
         
         prompt = self.create_data_rich_prompt(query, user_role, "rag", data)
-        response = self.safe_generate(prompt)
+        response = self.safe_generate(prompt, self.model_for("rag"))
         
         return {
             "response": response,
@@ -643,7 +817,7 @@ class EnhancedAIAgent:
             data = self.get_comprehensive_business_data(query)
         
         prompt = self.create_data_rich_prompt(query, user_role, "crag", data)
-        response = self.safe_generate(prompt)
+        response = self.safe_generate(prompt, self.model_for("crag"))
         
         return {
             "response": response,
@@ -653,36 +827,76 @@ class EnhancedAIAgent:
             "needs_human_review": False
         }
 
-# Create global instance
-try:
-    enhanced_ai_agent = EnhancedAIAgent()
-    if enhanced_ai_agent.available:
-        logger.info("✅ Enhanced AI Agent initialized successfully with full data integration")
-    else:
-        logger.warning("⚠️ Enhanced AI Agent initialized but not available - check Ollama")
-except Exception as e:
-    logger.error(f"💥 Failed to create Enhanced AI Agent: {e}")
-    # Fallback
-    class FallbackEnhancedAgent:
-        def __init__(self):
-            self.available = False
-        def supervisor_agent(self, query, user_role, conversation_history=None):
-            return {
-                "response": "Enhanced AI service is currently unavailable. Please check:\n1. Ollama is installed and running\n2. llama3.1:latest model is available\n3. Backend services are running",
-                "type": "error",
-                "data": {},
-                "reasoning": "Fallback mode - agent initialization failed",
-                "needs_human_review": True
-            }
-        def react_agent(self, query, user_role, data=None):
-            return self.supervisor_agent(query, user_role)
-        def planner_agent(self, query, user_role, data=None):
-            return self.supervisor_agent(query, user_role)
-        def analytics_agent(self, query, user_role, data=None):
-            return self.supervisor_agent(query, user_role)
-        def rag_agent(self, query, user_role, data=None):
-            return self.supervisor_agent(query, user_role)
-        def crag_agent(self, query, user_role, data=None):
-            return self.supervisor_agent(query, user_role)
+    # Agent type -> specialist method, looked up by _dispatch
+    _specialists = {
+        "react": react_agent,
+        "planner": planner_agent,
+        "analytics": analytics_agent,
+        "rag": rag_agent,
+        "crag": crag_agent,
+    }
+
+class FallbackEnhancedAgent:
+    """Stands in for the agent when it can't be created"""
     
-    enhanced_ai_agent = FallbackEnhancedAgent()
+    def __init__(self):
+        self.available = False
+
+    def warmup(self):
+        return False
+
+    def supervisor_agent(self, query, user_role, conversation_history=None):
+        return {
+            "response": "Enhanced AI service is currently unavailable. Please check:\n1. Ollama is installed and running\n2. llama3.1:latest model is available\n3. Backend services are running",
+            "type": "error",
+            "data": {},
+            "reasoning": "Fallback mode - agent initialization failed",
+            "needs_human_review": True
+        }
+
+    def _specialist(self, query, user_role, data=None):
+        return self.supervisor_agent(query, user_role)
+
+    # Every specialist answers with the same unavailable message
+    react_agent = planner_agent = analytics_agent = rag_agent = crag_agent = _specialist
+
+    def supervisor_agent_streaming(self, query, user_role, conversation_history=None):
+        result = self.supervisor_agent(query, user_role)
+        result["stream"] = iter([result.pop("response")])
+        return result
+
+    async def supervisor_agent_stream(self, query, user_role):
+        yield self.supervisor_agent(query, user_role)["response"]
+
+# The shared agent; get_enhanced_agent creates it under the lock on first use
+_enhanced_agent = None
+_enhanced_agent_lock = threading.Lock()
+
+def get_enhanced_agent():
+    """The shared agent, created on first use so importing this module stays fast
+    
+    Creating it probes Ollama, so the first callers may block for a while;
+    the lock makes concurrent first callers wait for one agent instead of
+    each building their own.
+    """
+    global _enhanced_agent
+    agent = _enhanced_agent
+    if agent is None:
+        with _enhanced_agent_lock:
+            agent = _enhanced_agent
+            if agent is None:
+                agent = _enhanced_agent = _create_enhanced_agent()
+    return agent
+
+def _create_enhanced_agent():
+    """EnhancedAIAgent, or the fallback agent when it can't be created"""
+    try:
+        agent = EnhancedAIAgent()
+        if agent.available:
+            logger.info("✅ Enhanced AI Agent initialized successfully with full data integration")
+        else:
+            logger.warning("⚠️ Enhanced AI Agent initialized but not available - check Ollama")
+        return agent
+    except Exception as e:
+        logger.error(f"💥 Failed to create Enhanced AI Agent: {e}")
+        return FallbackEnhancedAgent()
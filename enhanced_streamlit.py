@@ -6,10 +6,11 @@ from datetime import datetime
 import time
 import requests
 import json
-from typing import  List
+from itertools import chain
+from typing import  Iterable, List
 # Import the enhanced agent
 try:
-    from enhanced_agent import enhanced_ai_agent
+    from enhanced_agent import get_enhanced_agent
 except ImportError:
     # Fallback if import fails
     class FallbackAgent:
@@ -23,7 +24,19 @@ except ImportError:
                 "reasoning": "Import failed",
                 "needs_human_review": True
             }
-    enhanced_ai_agent = FallbackAgent()
+        def supervisor_agent_streaming(self, query, user_role, conversation_history=None):
+            result = self.supervisor_agent(query, user_role)
+            result["stream"] = iter([result.pop("response")])
+            return result
+    _fallback_agent = FallbackAgent()
+    
+    def get_enhanced_agent():
+        return _fallback_agent
+
+# Streamed text is flushed to its placeholder every STREAM_FLUSH_INTERVAL_MS or
+# every STREAM_BUFFER_TOKENS tokens, whichever comes first, not once per character
+STREAM_FLUSH_INTERVAL_MS = 25
+STREAM_BUFFER_TOKENS = 8
 
 def show_enhanced_ai_interface():
     """Enhanced AI interface with advanced features"""
@@ -57,6 +70,7 @@ def show_enhanced_ai_interface():
     visual_stories = st.sidebar.toggle("📊 Visual Storytelling", True)
     
     # Display agent status
+    enhanced_ai_agent = get_enhanced_agent()
     if hasattr(enhanced_ai_agent, 'available'):
         if enhanced_ai_agent.available:
             st.sidebar.success("✅ Enhanced Agent: Active")
@@ -78,11 +92,8 @@ def show_enhanced_ai_interface():
                     agent_emoji = get_agent_emoji(agent_type)
                     st.write(f"{agent_emoji} **{agent_type.upper()} Agent**")
                     
-                    # Display response content
-                    if real_time and len(msg.get("content", "")) > 100:
-                        display_streaming_text(msg["content"])
-                    else:
-                        st.write(msg["content"])
+                    # Display response content; finished messages are rendered once
+                    st.markdown(msg["content"])
                     
                     # Enhanced response features
                     if msg.get("tiered_responses"):
@@ -161,43 +172,67 @@ def show_enhanced_ai_interface():
     
     # Handle quick action queries
     if st.session_state.quick_action_query:
-        process_query(st.session_state.quick_action_query, expertise, visual_stories, response_style)
+        process_query(st.session_state.quick_action_query, expertise, visual_stories, response_style, real_time)
         st.session_state.quick_action_query = ""  # Reset after processing
     
     # Regular chat input
     user_input = st.chat_input("Ask me anything about your business...")
     
     if user_input:
-        process_query(user_input, expertise, visual_stories, response_style)
+        process_query(user_input, expertise, visual_stories, response_style, real_time)
 
-def display_streaming_text(text: str):
-    """Display text with streaming effect"""
+def display_streaming_text(tokens: Iterable[str]) -> str:
+    """Display tokens as they arrive and return the full text"""
     placeholder = st.empty()
     displayed_text = ""
-    
-    for char in text:
-        displayed_text += char
-        placeholder.write(displayed_text)
-        time.sleep(0.01)  # Adjust speed as needed
+    batch = []
+    last_flush = time.monotonic()
+    
+    for token in tokens:
+        batch.append(token)
+        now = time.monotonic()
+        if len(batch) >= STREAM_BUFFER_TOKENS or (now - last_flush) * 1000 >= STREAM_FLUSH_INTERVAL_MS:
+            displayed_text += "".join(batch)
+            placeholder.markdown(displayed_text)
+            batch.clear()
+            last_flush = now
+    
+    displayed_text += "".join(batch)
+    placeholder.markdown(displayed_text)
+    return displayed_text
 
-def process_query(user_input: str, expertise: str, visual_stories: bool, response_style: str):
-    """Process user query and generate enhanced response"""
+def process_query(user_input: str, expertise: str, visual_stories: bool, response_style: str, real_time: bool = True):
+    """Process user query and generate enhanced response
+    
+    With real_time off the reply is collected first and rendered in one call.
+    """
     # Add user message to chat
     st.session_state.enhanced_chat.append({"role": "user", "content": user_input})
     
     # Generate enhanced response
-    with st.spinner("🤔 Analyzing with multi-agent system..."):
-        try:
-            # Use the enhanced AI agent directly
-            response_data = enhanced_ai_agent.supervisor_agent(
+    try:
+        # Only the data collection blocks; the answer streams in below
+        with st.spinner("🤔 Analyzing with multi-agent system..."):
+            response_data = get_enhanced_agent().supervisor_agent_streaming(
                 query=user_input,
                 user_role=st.session_state.user.get('role', 'user'),
                 conversation_history=st.session_state.enhanced_chat
             )
-            
-            # Apply response style
-            styled_response = apply_response_style(response_data["response"], response_style)
-            
+        
+        with st.chat_message("assistant"):
+            agent_type = response_data.get("type", "supervisor")
+            st.write(f"{get_agent_emoji(agent_type)} **{agent_type.upper()} Agent**")
+            # The style only adds a heading, so it can be shown before the first token
+            tokens = chain([apply_response_style("", response_style)], response_data["stream"])
+            if real_time:
+                styled_response = display_streaming_text(tokens)
+            else:
+                with st.spinner("✍️ Writing the answer..."):
+                    styled_response = "".join(tokens)
+                st.markdown(styled_response)
+        
+        # Post-processing waits for the full text, after it has been shown
+        with st.spinner("📝 Preparing insights..."):
             # Create enhanced response object
             enhanced_response = {
                 "role": "assistant", 
@@ -220,15 +255,15 @@ def process_query(user_input: str, expertise: str, visual_stories: bool, respons
             
             st.session_state.enhanced_chat.append(enhanced_response)
             
-        except Exception as e:
-            # Fallback response
-            st.session_state.enhanced_chat.append({
-                "role": "assistant",
-                "content": f"I encountered an error: {str(e)}. Please check the enhanced agent setup.",
-                "agent_type": "error"
-            })
-        
-        st.rerun()
+    except Exception as e:
+        # Fallback response
+        st.session_state.enhanced_chat.append({
+            "role": "assistant",
+            "content": f"I encountered an error: {str(e)}. Please check the enhanced agent setup.",
+            "agent_type": "error"
+        })
+    
+    st.rerun()
 
 def apply_response_style(response: str, style: str) -> str:
     """Apply different response styles"""
@@ -1,26 +1,46 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
-from database import init_db
+from database import init_db, maintain_db, db, db_ro
 from crud import ProductCategoryCRUD, ProductCRUD
-from models import ProductCategoryCreate, ProductCategoryUpdate, ProductCreate, ProductUpdate, UserCreate, UserLogin, UserResponse
+from models import ProductCategoryCreate, ProductCategoryUpdate, ProductCreate, ProductUpdate, UserCreate, UserLogin, UserResponse, UserRoleUpdate
 from auth import AuthHandler
 from user_crud import UserCRUD
 from schemas import CRUDException
 from ai_agent import ai_agent
-from agent_tools import AICRUDTools
+from agent_tools import AICRUDTools, invalidate_analytics_cache
 import uvicorn
+import asyncio
 import logging
-from typing import  List
-from enhanced_agent import enhanced_ai_agent
+from typing import  List, Optional
+from enhanced_agent import get_enhanced_agent
 from enhanced_streamlit import show_enhanced_ai_interface
 
 
+# orjson is optional; it serializes responses several times faster than json
+try:
+    import orjson
+    DefaultResponse = ORJSONResponse
+except ImportError:
+    DefaultResponse = JSONResponse
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MAINTENANCE_INTERVAL = 6 * 60 * 60  # seconds between background vacuum/ANALYZE runs
+
+async def periodic_maintenance():
+    """Run database maintenance off the event loop every MAINTENANCE_INTERVAL"""
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        try:
+            await asyncio.to_thread(maintain_db)
+        except Exception as e:
+            logger.error(f"Database maintenance failed: {e}")
+
 # Lifespan events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -28,15 +48,21 @@ async def lifespan(app: FastAPI):
     logger.info("Initializing database...")
     init_db()
     UserCRUD.init_users_table()
+    maintenance = asyncio.create_task(periodic_maintenance())
+    # Connect the enhanced agent and load its model in the background, not on import
+    warmup = asyncio.create_task(asyncio.to_thread(lambda: get_enhanced_agent().warmup()))
     logger.info("Application started successfully!")
     yield
     # Shutdown
+    maintenance.cancel()
+    warmup.cancel()
     logger.info("Application shutting down...")
 
 app = FastAPI(
     title="Master-Detail CRUD API with AI Agent", 
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultResponse
 )
 
 # Add CORS middleware
@@ -48,28 +74,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# POST routes that don't modify data
+_READ_ONLY_POSTS = {"/login", "/ai/query", "/ai/enhanced-query", "/ai/enhanced-query/stream"}
+
+@app.middleware("http")
+async def invalidate_analytics_on_write(request, call_next):
+    """Drop cached agent analytics once a write request succeeds"""
+    response = await call_next(request)
+    if (request.method in ("POST", "PUT", "DELETE") and response.status_code < 400
+            and request.url.path not in _READ_ONLY_POSTS):
+        invalidate_analytics_cache()
+    return response
+
 security = HTTPBearer()
 auth_handler = AuthHandler()
 
 # Role-based dependency functions
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def _authenticate(credentials: HTTPAuthorizationCredentials, conn):
     token = credentials.credentials
     payload = auth_handler.verify_token(token)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = UserCRUD.get_user_by_username(payload.get("sub"))
+    user = UserCRUD.get_user_by_username(payload.get("sub"), conn)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     return user
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), conn=Depends(db_ro)):
+    return _authenticate(credentials, conn)
+
+# Write routes depend on db themselves; FastAPI caches it per request, so the
+# user lookup runs on that same connection instead of borrowing a second one
+async def get_current_user_rw(credentials: HTTPAuthorizationCredentials = Depends(security), conn=Depends(db)):
+    return _authenticate(credentials, conn)
+
 async def require_admin(current_user: dict = Depends(get_current_user)):
     if current_user["role_name"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
-async def require_manager_or_admin(current_user: dict = Depends(get_current_user)):
+# Only the category/product write routes use this, so it reads the user on their write connection
+async def require_manager_or_admin(current_user: dict = Depends(get_current_user_rw)):
     if current_user["role_name"] not in ["admin", "manager"]:
         raise HTTPException(status_code=403, detail="Manager or admin access required")
     return current_user
@@ -128,7 +175,7 @@ async def query_ai_agent(
         if not user_input:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        result = ai_agent.process_query(
+        result = await ai_agent.process_query(
             user_input=user_input,
             user_role=current_user["role_name"]
         )
@@ -160,7 +207,7 @@ async def get_low_stock_analytics(current_user: dict = Depends(require_user)):
     3. Recommended actions
     """
     
-    ai_insights = ai_agent.process_query(
+    ai_insights = await ai_agent.process_query(
         user_input=insight_prompt,
         user_role=current_user["role_name"]
     )
@@ -189,7 +236,7 @@ async def get_system_health_ai(current_user: dict = Depends(require_user)):
     3. Recommendations for improvement
     """
     
-    ai_insights = ai_agent.process_query(
+    ai_insights = await ai_agent.process_query(
         user_input=insight_prompt,
         user_role=current_user["role_name"]
     )
@@ -215,7 +262,7 @@ async def get_sales_trends_ai(current_user: dict = Depends(require_user)):
     3. Growth opportunities
     """
     
-    ai_insights = ai_agent.process_query(
+    ai_insights = await ai_agent.process_query(
         user_input=insight_prompt,
         user_role=current_user["role_name"]
     )
@@ -227,13 +274,22 @@ async def get_sales_trends_ai(current_user: dict = Depends(require_user)):
 
 # User Management Routes (Admin only)
 @app.get("/admin/users", summary="Get all users", dependencies=[Depends(require_admin)])
-async def get_all_users():
-    return UserCRUD.get_all_users()
+async def get_all_users(offset: int = 0, limit: Optional[int] = None, fields: Optional[str] = None):
+    if fields == "username":
+        return UserCRUD.get_all_usernames()
+    return UserCRUD.get_all_users(offset, limit)
 
 @app.post("/admin/users", summary="Create new user with role", dependencies=[Depends(require_admin)])
 async def create_user_with_role(user: UserCreate):
     return UserCRUD.create_user(user.username, user.email, user.password, user.full_name, user.role_id)
 
+@app.put("/admin/users/roles", summary="Update several user roles at once", dependencies=[Depends(require_admin)])
+async def update_user_roles(role_updates: List[UserRoleUpdate]):
+    if not role_updates:
+        raise HTTPException(status_code=400, detail="At least one role update is required")
+    
+    return UserCRUD.update_user_roles([(u.username, u.role_id) for u in role_updates], "admin")
+
 @app.put("/admin/users/{username}/role", summary="Update user role", dependencies=[Depends(require_admin)])
 async def update_user_role(username: str, role_update: dict):
     role_id = role_update.get("role_id")
@@ -246,53 +302,58 @@ async def update_user_role(username: str, role_update: dict):
 async def delete_user(username: str):
     return UserCRUD.delete_user(username, "admin")
 
+@app.post("/admin/maintenance", summary="Reclaim free pages and refresh statistics", dependencies=[Depends(require_admin)])
+async def run_maintenance():
+    await asyncio.to_thread(maintain_db)
+    return {"message": "Database maintenance completed"}
+
 # Protected Routes with Role-Based Access
 
 # Product Category Routes
 @app.post("/categories/", summary="Create product category", dependencies=[Depends(require_manager_or_admin)])
-async def create_category(category: ProductCategoryCreate):
-    return ProductCategoryCRUD.create_category(category)
+async def create_category(category: ProductCategoryCreate, conn=Depends(db)):
+    return ProductCategoryCRUD.create_category(category, conn)
 
 @app.get("/categories/{category_id}/{subcategory_id}", summary="Get category by composite key", dependencies=[Depends(require_user)])
-async def get_category(category_id: int, subcategory_id: int):
-    return ProductCategoryCRUD.get_category(category_id, subcategory_id)
+async def get_category(category_id: int, subcategory_id: int, conn=Depends(db_ro)):
+    return ProductCategoryCRUD.get_category(category_id, subcategory_id, conn)
 
 @app.get("/categories/", summary="Get all categories", dependencies=[Depends(require_user)])
-async def get_all_categories():
-    return ProductCategoryCRUD.get_all_categories()
+async def get_all_categories(conn=Depends(db_ro)):
+    return ProductCategoryCRUD.get_all_categories(conn)
 
 @app.put("/categories/{category_id}/{subcategory_id}", summary="Update category", dependencies=[Depends(require_manager_or_admin)])
-async def update_category(category_id: int, subcategory_id: int, category: ProductCategoryUpdate):
-    return ProductCategoryCRUD.update_category(category_id, subcategory_id, category)
+async def update_category(category_id: int, subcategory_id: int, category: ProductCategoryUpdate, conn=Depends(db)):
+    return ProductCategoryCRUD.update_category(category_id, subcategory_id, category, conn)
 
 @app.delete("/categories/{category_id}/{subcategory_id}", summary="Delete category", dependencies=[Depends(require_manager_or_admin)])
-async def delete_category(category_id: int, subcategory_id: int):
-    return ProductCategoryCRUD.delete_category(category_id, subcategory_id)
+async def delete_category(category_id: int, subcategory_id: int, conn=Depends(db)):
+    return ProductCategoryCRUD.delete_category(category_id, subcategory_id, conn)
 
 # Product Routes
 @app.post("/products/", summary="Create product", dependencies=[Depends(require_manager_or_admin)])
-async def create_product(product: ProductCreate):
-    return ProductCRUD.create_product(product)
+async def create_product(product: ProductCreate, conn=Depends(db)):
+    return ProductCRUD.create_product(product, conn)
 
 @app.get("/products/{product_id}", summary="Get product by ID", dependencies=[Depends(require_user)])
-async def get_product(product_id: int):
-    return ProductCRUD.get_product(product_id)
+async def get_product(product_id: int, conn=Depends(db_ro)):
+    return ProductCRUD.get_product(product_id, conn)
 
 @app.get("/products/", summary="Get all products", dependencies=[Depends(require_user)])
-async def get_all_products():
-    return ProductCRUD.get_all_products()
+async def get_all_products(conn=Depends(db_ro)):
+    return ProductCRUD.get_all_products(conn)
 
 @app.get("/products/category/{category_id}/{subcategory_id}", summary="Get products by category", dependencies=[Depends(require_user)])
-async def get_products_by_category(category_id: int, subcategory_id: int):
-    return ProductCRUD.get_products_by_category(category_id, subcategory_id)
+async def get_products_by_category(category_id: int, subcategory_id: int, conn=Depends(db_ro)):
+    return ProductCRUD.get_products_by_category(category_id, subcategory_id, conn)
 
 @app.put("/products/{product_id}", summary="Update product", dependencies=[Depends(require_manager_or_admin)])
-async def update_product(product_id: int, product: ProductUpdate):
-    return ProductCRUD.update_product(product_id, product)
+async def update_product(product_id: int, product: ProductUpdate, conn=Depends(db)):
+    return ProductCRUD.update_product(product_id, product, conn)
 
 @app.delete("/products/{product_id}", summary="Delete product", dependencies=[Depends(require_manager_or_admin)])
-async def delete_product(product_id: int):
-    return ProductCRUD.delete_product(product_id)
+async def delete_product(product_id: int, conn=Depends(db)):
+    return ProductCRUD.delete_product(product_id, conn)
 
 # Public routes
 @app.get("/")
@@ -336,6 +397,7 @@ async def ai_status():
                 else:
                     model_names.append(str(model))
             
+            await ai_agent.ensure_ready()
             agent_ready = ai_agent.is_available()
             current_model = ai_agent.model if hasattr(ai_agent, 'model') else "none"
             
@@ -366,6 +428,14 @@ async def ai_status():
             "message": "Ollama not installed or not running"
         }
 
+async def enhanced_agent():
+    """The shared enhanced agent, fetched from a worker thread
+    
+    While the startup warmup is still creating it, get_enhanced_agent blocks
+    on its lock; that wait must not happen on the event loop.
+    """
+    return await asyncio.to_thread(get_enhanced_agent)
+
 @app.post("/ai/enhanced-query", summary="Enhanced AI Agent Query")
 async def enhanced_ai_query(
     query_data: dict, 
@@ -379,8 +449,11 @@ async def enhanced_ai_query(
         if not user_input:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        # Use enhanced agent with supervisor pattern
-        result = enhanced_ai_agent.supervisor_agent(
+        # Use enhanced agent with supervisor pattern; off the event loop so
+        # concurrent requests can share identical generations
+        agent = await enhanced_agent()
+        result = await asyncio.to_thread(
+            agent.supervisor_agent,
             query=user_input,
             user_role=current_user["role_name"],
             conversation_history=[]  # You can add conversation memory here
@@ -402,6 +475,27 @@ async def enhanced_ai_query(
         logger.error(f"Enhanced AI query error: {e}")
         raise HTTPException(status_code=500, detail=f"AI processing error: {str(e)}")
 
+@app.post("/ai/enhanced-query/stream", summary="Enhanced AI Agent Query (streamed)")
+async def enhanced_ai_query_stream(
+    query_data: dict, 
+    current_user: dict = Depends(require_user)
+):
+    """Enhanced query that streams the response text as the model generates it"""
+    user_input = query_data.get("query", "")
+    response_style = query_data.get("response_style", "Conversational")
+    
+    if not user_input:
+        raise HTTPException(status_code=400, detail="Query is required")
+    
+    async def tokens():
+        # The style only adds a heading, so it can go out before the first token
+        yield apply_response_style("", response_style)
+        agent = await enhanced_agent()
+        async for token in agent.supervisor_agent_stream(user_input, current_user["role_name"]):
+            yield token
+    
+    return StreamingResponse(tokens(), media_type="text/plain; charset=utf-8")
+
 def apply_response_style(response: str, style: str) -> str:
     """Apply different response styles to the AI output"""
     if style == "Formal":
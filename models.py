@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, validator, ConfigDict
 from typing import Optional
 from decimal import Decimal
+from datetime import datetime
 from enum import Enum
 
 # Role Enum for easy access
@@ -74,6 +75,10 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+class UserRoleUpdate(BaseModel):
+    username: str
+    role_id: int = Field(..., ge=1, le=3, description="1=admin, 2=manager, 3=user")
+
 # Role models
 class Role(BaseModel):
     role_id: int
@@ -88,4 +93,4 @@ class UserResponse(BaseModel):
     role_id: int
     role_name: str
     is_active: bool
-    created_at: str
\ No newline at end of file
+    created_at: datetime
\ No newline at end of file
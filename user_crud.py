@@ -1,9 +1,31 @@
-from database import get_db_connection
+from database import begin_write, get_db_connection_ro, use_connection
 from auth import AuthHandler
 from schemas import CRUDException
 import sqlite3
 import re
 
+# Fixed statement text so pooled connections reuse their prepared statements
+SQL_INSERT_USER = "INSERT INTO users (username, email, hashed_password, full_name, role_id) VALUES (?, ?, ?, ?, ?)"
+SQL_USER_BY_USERNAME = """
+    SELECT u.*, r.role_name 
+    FROM users u 
+    JOIN roles r ON u.role_id = r.role_id 
+    WHERE u.username = ? AND u.is_active = TRUE
+"""
+SQL_ALL_USERS = """
+    SELECT u.id, u.username, u.email, u.full_name, u.role_id, r.role_name, u.is_active, u.created_at
+    FROM users u 
+    JOIN roles r ON u.role_id = r.role_id
+    ORDER BY u.created_at DESC
+    LIMIT ? OFFSET ?
+"""
+SQL_ALL_USERNAMES = "SELECT username FROM users ORDER BY created_at DESC"
+SQL_USER_EXISTS = "SELECT 1 FROM users WHERE username = ?"
+SQL_USERNAME_OR_EMAIL_EXISTS = "SELECT 1 FROM users WHERE username = ? OR email = ?"
+SQL_UPDATE_PASSWORD = "UPDATE users SET hashed_password = ? WHERE username = ?"
+SQL_UPDATE_ROLE = "UPDATE users SET role_id = ? WHERE username = ?"
+SQL_DELETE_USER = "DELETE FROM users WHERE username = ?"
+
 class UserCRUD:
     @staticmethod
     def validate_email(email: str) -> bool:
@@ -26,32 +48,28 @@ class UserCRUD:
     def init_users_table():
         """Initialize users table with some sample users"""
         try:
-            with get_db_connection() as conn:
+            # Create sample users with different roles; hash before taking the write lock
+            sample_users = [
+                ("admin", "admin@example.com", AuthHandler.get_password_hash("admin123"), "Administrator", 1),  # admin
+                ("manager", "manager@example.com", AuthHandler.get_password_hash("manager123"), "Manager User", 2),  # manager
+                ("user1", "user1@example.com", AuthHandler.get_password_hash("password123"), "Regular User", 3),  # user
+                ("testuser", "test@example.com", AuthHandler.get_password_hash("test123"), "Test User", 3),  # user
+            ]
+            
+            with begin_write() as conn:
                 cursor = conn.cursor()
                 
                 # Clear existing sample users to avoid conflicts
                 cursor.execute("DELETE FROM users WHERE username IN ('admin', 'user1', 'manager', 'testuser')")
                 
-                # Create sample users with different roles
-                sample_users = [
-                    ("admin", "admin@example.com", AuthHandler.get_password_hash("admin123"), "Administrator", 1),  # admin
-                    ("manager", "manager@example.com", AuthHandler.get_password_hash("manager123"), "Manager User", 2),  # manager
-                    ("user1", "user1@example.com", AuthHandler.get_password_hash("password123"), "Regular User", 3),  # user
-                    ("testuser", "test@example.com", AuthHandler.get_password_hash("test123"), "Test User", 3),  # user
-                ]
-                
                 for username, email, hashed_password, full_name, role_id in sample_users:
                     try:
-                        cursor.execute(
-                            "INSERT INTO users (username, email, hashed_password, full_name, role_id) VALUES (?, ?, ?, ?, ?)",
-                            (username, email, hashed_password, full_name, role_id)
-                        )
+                        cursor.execute(SQL_INSERT_USER, (username, email, hashed_password, full_name, role_id))
                         print(f"✅ Created user: {username} with role_id: {role_id}")
                     except sqlite3.IntegrityError as e:
                         print(f"⚠️ User {username} already exists: {e}")
                         continue
                 
-                conn.commit()
                 print("✅ Users initialized successfully!")
                 
         except Exception as e:
@@ -59,16 +77,11 @@ class UserCRUD:
             raise
 
     @staticmethod
-    def get_user_by_username(username: str):
+    def get_user_by_username(username: str, conn=None):
         try:
-            with get_db_connection() as conn:
+            with use_connection(conn, read_only=True) as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT u.*, r.role_name 
-                    FROM users u 
-                    JOIN roles r ON u.role_id = r.role_id 
-                    WHERE u.username = ? AND u.is_active = TRUE
-                ''', (username,))
+                cursor.execute(SQL_USER_BY_USERNAME, (username,))
                 user = cursor.fetchone()
                 return dict(user) if user else None
         except Exception as e:
@@ -76,23 +89,31 @@ class UserCRUD:
             return None
 
     @staticmethod
-    def get_all_users():
-        """Get all users with their roles"""
+    def get_all_users(offset: int = 0, limit: int = None):
+        """Get all users with their roles, optionally one page at a time"""
         try:
-            with get_db_connection() as conn:
+            with get_db_connection_ro() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT u.id, u.username, u.email, u.full_name, u.role_id, r.role_name, u.is_active, u.created_at
-                    FROM users u 
-                    JOIN roles r ON u.role_id = r.role_id
-                    ORDER BY u.created_at DESC
-                ''')
+                # SQLite treats a negative LIMIT as "no limit"
+                cursor.execute(SQL_ALL_USERS, (limit if limit is not None else -1, offset))
                 users = cursor.fetchall()
                 return [dict(user) for user in users]
         except Exception as e:
             print(f"❌ Error getting all users: {e}")
             return []
 
+    @staticmethod
+    def get_all_usernames():
+        """Get just the usernames of all users"""
+        try:
+            with get_db_connection_ro() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_ALL_USERNAMES)
+                return [{"username": row["username"]} for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"❌ Error getting usernames: {e}")
+            return []
+
     @staticmethod
     def authenticate_user(username: str, password: str):
         try:
@@ -106,6 +127,13 @@ class UserCRUD:
             is_valid = AuthHandler.verify_password(password, user["hashed_password"])
             print(f"🔑 Password valid: {is_valid}")
             
+            # Move old hashes onto the current Argon2 parameters while we have the password
+            if is_valid and AuthHandler.password_needs_rehash(user["hashed_password"]):
+                new_hash = AuthHandler.get_password_hash(password)
+                with begin_write() as conn:
+                    conn.execute(SQL_UPDATE_PASSWORD, (new_hash, username))
+                print(f"🔄 Rehashed password for: {username}")
+            
             return user if is_valid else False
         except Exception as e:
             print(f"❌ Authentication error for {username}: {e}")
@@ -124,21 +152,18 @@ class UserCRUD:
         if role_id not in [1, 2, 3]:
             raise CRUDException("Invalid role ID. Must be 1 (admin), 2 (manager), or 3 (user)", 400)
         
+        # Hash before taking the write lock; Argon2 is deliberately slow
+        hashed_password = AuthHandler.get_password_hash(password)
         try:
-            with get_db_connection() as conn:
+            with begin_write() as conn:
                 cursor = conn.cursor()
                 
                 # Check if user already exists
-                cursor.execute("SELECT * FROM users WHERE username = ? OR email = ?", (username, email))
+                cursor.execute(SQL_USERNAME_OR_EMAIL_EXISTS, (username, email))
                 if cursor.fetchone():
                     raise CRUDException("Username or email already exists", 400)
                 
-                hashed_password = AuthHandler.get_password_hash(password)
-                cursor.execute(
-                    "INSERT INTO users (username, email, hashed_password, full_name, role_id) VALUES (?, ?, ?, ?, ?)",
-                    (username, email, hashed_password, full_name, role_id)
-                )
-                conn.commit()
+                cursor.execute(SQL_INSERT_USER, (username, email, hashed_password, full_name, role_id))
                 
                 return {
                     "username": username, 
@@ -161,19 +186,15 @@ class UserCRUD:
             raise CRUDException("Invalid role ID", 400)
         
         try:
-            with get_db_connection() as conn:
+            with begin_write() as conn:
                 cursor = conn.cursor()
                 
                 # Check if user exists
-                cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
+                cursor.execute(SQL_USER_EXISTS, (username,))
                 if not cursor.fetchone():
                     raise CRUDException("User not found", 404)
                 
-                cursor.execute(
-                    "UPDATE users SET role_id = ? WHERE username = ?",
-                    (role_id, username)
-                )
-                conn.commit()
+                cursor.execute(SQL_UPDATE_ROLE, (role_id, username))
                 
                 return {
                     "message": f"User {username} role updated to {UserCRUD.get_role_name(role_id)}",
@@ -183,6 +204,43 @@ class UserCRUD:
         except sqlite3.Error as e:
             raise CRUDException(f"Database error: {e}", 500)
 
+    @staticmethod
+    def update_user_roles(updates, current_user_role: str):
+        """Update several users' roles in one transaction (only admin can do this)"""
+        if current_user_role != "admin":
+            raise CRUDException("Only administrators can update user roles", 403)
+        
+        if any(role_id not in [1, 2, 3] for _, role_id in updates):
+            raise CRUDException("Invalid role ID", 400)
+        
+        usernames = [username for username, _ in updates]
+        try:
+            with begin_write() as conn:
+                cursor = conn.cursor()
+                
+                # Check that every user exists
+                placeholders = ", ".join("?" for _ in usernames)
+                cursor.execute(f"SELECT username FROM users WHERE username IN ({placeholders})", usernames)
+                found = {row["username"] for row in cursor.fetchall()}
+                missing = [username for username in usernames if username not in found]
+                if missing:
+                    raise CRUDException(f"User not found: {', '.join(missing)}", 404)
+                
+                cursor.executemany(
+                    SQL_UPDATE_ROLE,
+                    [(role_id, username) for username, role_id in updates]
+                )
+                
+                return {
+                    "message": f"Updated roles for {len(updates)} users",
+                    "updated": [
+                        {"username": username, "new_role": UserCRUD.get_role_name(role_id)}
+                        for username, role_id in updates
+                    ]
+                }
+        except sqlite3.Error as e:
+            raise CRUDException(f"Database error: {e}", 500)
+
     @staticmethod
     def delete_user(username: str, current_user_role: str):
         """Delete user (only admin can do this)"""
@@ -190,11 +248,11 @@ class UserCRUD:
             raise CRUDException("Only administrators can delete users", 403)
         
         try:
-            with get_db_connection() as conn:
+            with begin_write() as conn:
                 cursor = conn.cursor()
                 
                 # Check if user exists
-                cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
+                cursor.execute(SQL_USER_EXISTS, (username,))
                 if not cursor.fetchone():
                     raise CRUDException("User not found", 404)
                 
@@ -202,8 +260,7 @@ class UserCRUD:
                 if username == "admin":
                     raise CRUDException("Cannot delete the main admin user", 400)
                 
-                cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-                conn.commit()
+                cursor.execute(SQL_DELETE_USER, (username,))
                 
                 return {"message": f"User {username} deleted successfully"}
         except sqlite3.Error as e: